@@ -0,0 +1,59 @@
+import json
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from foodgram.versioning import get_versions
+
+RESPONSE_CACHE_KEY = 'foodgram:response:{}'
+
+
+class AnonymousCacheMixin:
+    """Кеширует ответы list и retrieve для анонимных пользователей.
+
+    Ответы анонимам одинаковы для всех, поэтому данные сериализатора
+    сохраняются в кеш RESPONSE_CACHE_ALIAS. Ключ строится из пути,
+    отсортированных параметров запроса и версий из cache_versions:
+    изменение данных меняет версию, и старые записи перестают читаться.
+    Набор версий для запроса можно уточнить в get_cache_versions().
+    """
+
+    cache_versions = ()
+
+    def get_cache_versions(self):
+        return self.cache_versions
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        cache = caches[settings.RESPONSE_CACHE_ALIAS]
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def get_response_cache_key(self, request):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        )
+        versions = get_versions(self.get_cache_versions())
+        raw_key = json.dumps([request.path, params, versions])
+        return RESPONSE_CACHE_KEY.format(md5(raw_key.encode()).hexdigest())
@@ -0,0 +1,86 @@
+import time
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.versioning import get_versions, user_version
+
+
+class ConditionalResponse(Exception):
+    """Прерывает обработку запроса готовым ответом 304 или 412."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalRequestMixin:
+    """Поддержка ETag, Last-Modified и условных запросов.
+
+    Валидаторы вычисляются до выполнения представления по версиям данных
+    из get_condition_versions() и идентификатору пользователя, поэтому
+    на If-None-Match/If-Modified-Since ответ 304 отдаётся без запросов
+    к базе и сериализации. If-Match/If-Unmodified-Since проверяются и
+    для изменяющих запросов, при несовпадении возвращается 412.
+    Если get_condition_timeout() возвращает число секунд, валидаторы
+    меняются и по времени: так обновляются данные, изменение которых
+    намеренно не меняет версий.
+    """
+
+    condition_versions = ()
+    condition_timeout = None
+
+    def get_condition_versions(self):
+        return self.condition_versions
+
+    def get_condition_timeout(self):
+        return self.condition_timeout
+
+    def get_condition_version_values(self, request, names):
+        return get_versions(names)
+
+    def get_validators(self, request):
+        names = list(self.get_condition_versions())
+        if request.user.is_authenticated:
+            names.append(user_version(request.user.pk))
+        versions = self.get_condition_version_values(request, names)
+        timeout = self.get_condition_timeout()
+        if timeout:
+            versions.append(time.time() // timeout * timeout)
+        raw_etag = repr([request.path, request.user.pk, versions])
+        etag = quote_etag(md5(raw_etag.encode()).hexdigest())
+        return etag, int(max(versions, default=0))
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag, self.last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=self.last_modified,
+        )
+        if response is not None:
+            raise ConditionalResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (request.method in SAFE_METHODS
+                and response.status_code == 200
+                and getattr(self, 'etag', None)):
+            # Сжатое тело отличается побайтно, поэтому валидатор слабый.
+            response['ETag'] = (
+                'W/' + self.etag
+                if response.has_header('Content-Encoding') else self.etag
+            )
+            response['Last-Modified'] = http_date(self.last_modified)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
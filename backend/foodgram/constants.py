@@ -1,5 +1,6 @@
 # Project Settings
 PAGE_SIZE = 6
+MAX_PAGE_SIZE = 100
 
 # Recipe
 MAX_LENGTH_RECIPE_NAME = 200
@@ -11,6 +12,30 @@ MAX_LENGTH_TAG_COLOR = 7
 MAX_LENGTH_TAG_SLUG = 200
 MIN_COOKING_TIME = 1
 
+# Recipe images
+IMAGE_VARIANT_SIZES = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+IMAGE_VARIANT_QUALITY = 80
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40000000
+BASE64_CHUNK_SIZE = 64 * 1024
+IMAGE_SPOOL_MAX_SIZE = 1024 * 1024
+
+# Subscription feed
+FEED_FAN_OUT_BATCH_SIZE = 1000
+FEED_BACKFILL_LIMIT = 200
+
+# Similar recipes
+SIMILAR_RECIPES_COUNT = 10
+SIMILARITY_TAG_WEIGHT = 0.5
+SIMILARITY_BLOCK_CELLS = 10000000
+
 # User
 MAX_LENGTH_USER_CHARFIELD = 150
 MAX_LENGTH_USER_EMAIL = 254
+
+# Profiling
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_PARAMS_MAX_LENGTH = 1000
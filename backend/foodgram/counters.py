@@ -0,0 +1,78 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def get_counters(apps):
+    """Денормализованные счётчики: (модель, поле, источник, связь).
+
+    apps — реестр моделей.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    return (
+        (Recipe, 'favorites_count', apps.get_model('recipes', 'Favorite'),
+         'recipe'),
+        (Recipe, 'in_carts_count', apps.get_model('recipes', 'ShoppingCart'),
+         'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'followers_count', apps.get_model('users', 'Follow'),
+         'author'),
+    )
+
+
+class CountersModelMixin:
+    """Модель со счётчиками, которые не перезаписываются при save().
+
+    Счётчики меняются только через change_counter и reconcile_counters;
+    сохранение всего объекта записало бы прочитанные ранее значения
+    поверх конкурентных изменений, поэтому поля counter_fields в такое
+    сохранение не входят.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')
+                and not self._state.adding):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счётчик на delta, не опуская его ниже нуля."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, Value(0))}
+    )
+
+
+def reconcile_counters(counters, dry_run=False):
+    """Сверяет счётчики с фактическими данными и исправляет расхождения.
+
+    Возвращает количество расходящихся строк для каждого счётчика.
+    """
+    drift = {}
+    for model, field, source, relation in counters:
+        actual = Coalesce(
+            Subquery(
+                source.objects.filter(
+                    **{relation: OuterRef('pk')}
+                ).order_by().values(relation).annotate(
+                    total=Count('pk')
+                ).values('total')
+            ),
+            0,
+        )
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        )
+        drift[f'{model._meta.label}.{field}'] = drifted.count()
+        if not dry_run:
+            model.objects.filter(
+                pk__in=drifted.values('pk')
+            ).update(**{field: actual})
+    return drift
@@ -0,0 +1,87 @@
+import uuid
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+
+import foodgram.constants as const
+
+IMAGE_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'PNG': ('png', 'image/png'),
+    'GIF': ('gif', 'image/gif'),
+    'WEBP': ('webp', 'image/webp'),
+}
+
+
+class ImageField(serializers.FileField):
+    """Фото в виде base64 (data URI) или загруженного файла.
+
+    Base64 декодируется частями во временный файл с ограничением размера,
+    так что в памяти не появляется копия изображения целиком. Файл
+    проверяется Pillow с ограничением числа пикселей.
+    """
+
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'too_many_pixels': 'Изображение больше {max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+        file = super().to_internal_value(data)
+        if file.size > const.MAX_IMAGE_SIZE:
+            self.fail('too_large', max_size=const.MAX_IMAGE_SIZE)
+        self.verify(file)
+        return file
+
+    def decode(self, data):
+        marker = ';base64,'
+        offset = data.find(marker)
+        if offset == -1:
+            self.fail('invalid_image')
+        offset += len(marker)
+        file = File(
+            SpooledTemporaryFile(max_size=const.IMAGE_SPOOL_MAX_SIZE),
+            'image',
+        )
+        size = 0
+        try:
+            for start in range(offset, len(data), const.BASE64_CHUNK_SIZE):
+                chunk = b64decode(
+                    data[start:start + const.BASE64_CHUNK_SIZE],
+                    validate=True,
+                )
+                size += len(chunk)
+                if size > const.MAX_IMAGE_SIZE:
+                    self.fail('too_large', max_size=const.MAX_IMAGE_SIZE)
+                file.write(chunk)
+        except ValueError:
+            # binascii.Error для неверных символов base64 и ValueError для
+            # символов вне ASCII.
+            self.fail('invalid_image')
+        file.size = size
+        file.seek(0)
+        return file
+
+    def verify(self, file):
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                if image.width * image.height > const.MAX_IMAGE_PIXELS:
+                    self.fail(
+                        'too_many_pixels', max_pixels=const.MAX_IMAGE_PIXELS
+                    )
+                if image.format not in IMAGE_FORMATS:
+                    self.fail('invalid_image')
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        extension, content_type = IMAGE_FORMATS[image.format]
+        file.name = f'{uuid.uuid4()}.{extension}'
+        file.content_type = content_type
+        file.seek(0)
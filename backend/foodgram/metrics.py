@@ -0,0 +1,120 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+LABELS = ('route', 'method')
+
+REQUESTS = Counter(
+    'foodgram_http_requests',
+    'Количество обработанных запросов',
+    LABELS + ('status',),
+)
+REQUEST_DURATION = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки запроса',
+    LABELS,
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Количество SQL-запросов на запрос',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов на запрос',
+    LABELS,
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_http_response_size_bytes',
+    'Размер тела ответа',
+    LABELS,
+    buckets=tuple(2 ** power for power in range(8, 25, 2)),
+)
+
+
+class QueryTimer:
+    """Обёртка выполнения SQL, считающая запросы и их время."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def counting(content, observe):
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    observe(size)
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса по имени маршрута и методу.
+
+    Отключается настройкой METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unresolved', request.method)
+        REQUESTS.labels(*labels, response.status_code).inc()
+        REQUEST_DURATION.labels(*labels).observe(duration)
+        DB_QUERIES.labels(*labels).observe(timer.count)
+        DB_DURATION.labels(*labels).observe(timer.duration)
+        size = RESPONSE_SIZE.labels(*labels)
+        if response.streaming:
+            response.streaming_content = counting(
+                response.streaming_content, size.observe
+            )
+        else:
+            size.observe(len(response.content))
+        return response
+
+
+class MetricsView(APIView):
+    """Метрики в текстовом формате Prometheus, только для персонала.
+
+    Если задан PROMETHEUS_MULTIPROC_DIR, значения собираются из файлов
+    всех процессов gunicorn в этом каталоге.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        registry = REGISTRY
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return HttpResponse(
+            generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+        )
@@ -1,5 +1,297 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+import foodgram.constants as const
+from foodgram.versioning import get_versions
+
+COUNT_CACHE_KEY = 'foodgram:count:{}'
+
+
+class EstimatedCount(int):
+    """Количество записей по оценке планировщика, а не точное."""
+
+
+def exact_count(queryset):
+    return queryset.count()
+
+
+def estimated_count(queryset):
+    """Оценка количества строк планировщиком PostgreSQL.
+
+    Небольшие выборки, для которых оценка ниже порога, считаются точно.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    rows = int(plan[0]['Plan']['Plan Rows'])
+    if rows < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+        return queryset.count()
+    return EstimatedCount(rows)
+
+
+class CountStrategyPaginator(DjangoPaginator):
+    """Paginator, получающий общее количество через переданную функцию."""
+
+    def __init__(self, object_list, per_page, count_function, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_function = count_function
+
+    @cached_property
+    def count(self):
+        return self.count_function(self.object_list)
+
+    def validate_number(self, number):
+        if not isinstance(self.count, EstimatedCount):
+            return super().validate_number(number)
+        # Оценка может быть меньше реального количества, поэтому номер
+        # страницы не ограничивается сверху.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не является целым числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        if not isinstance(self.count, EstimatedCount):
+            return super().page(number)
+        # Границы страницы и наличие следующей определяются по данным,
+        # а не по оценке count.
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        return EstimatedPage(
+            objects[:self.per_page],
+            number,
+            self,
+            len(objects) > self.per_page,
+        )
+
+
+class EstimatedPage(Page):
+    """Страница выборки, количество записей в которой оценено."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничный вывод с настраиваемым способом подсчёта количества.
+
+    Стратегия задаётся настройкой PAGINATION_COUNT_STRATEGY:
+    exact — точный COUNT(*); cached — точный COUNT(*), закешированный
+    на PAGINATION_COUNT_CACHE_TIMEOUT секунд для набора параметров запроса
+    и сбрасываемый при изменении версий view.count_versions; estimated —
+    оценка планировщика для выборок больше
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD строк.
+    """
+
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_function = self.get_count_function(request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountStrategyPaginator(
+            object_list,
+            per_page,
+            self.count_function,
+        )
+
+    def get_count_function(self, request, view):
+        strategy = settings.PAGINATION_COUNT_STRATEGY
+        if strategy == 'estimated':
+            return estimated_count
+        if strategy == 'cached' and hasattr(view, 'get_count_versions'):
+            key = self.get_count_cache_key(request, view)
+            return lambda queryset: cache.get_or_set(
+                key,
+                queryset.count,
+                settings.PAGINATION_COUNT_CACHE_TIMEOUT,
+            )
+        return exact_count
+
+    def get_count_cache_key(self, request, view):
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            if name not in (self.page_query_param, self.page_size_query_param)
+            for value in values
+        )
+        versions = get_versions(view.get_count_versions())
+        raw_key = json.dumps([request.path, request.user.pk, params, versions])
+        return COUNT_CACHE_KEY.format(md5(raw_key.encode()).hexdigest())
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по курсору без COUNT(*) и OFFSET.
+
+    Курсор содержит значения полей сортировки последнего объекта
+    страницы, следующая страница выбирается условием «строго после него»,
+    поэтому время получения страницы не зависит от её номера.
+    Порядок задаётся атрибутом представления cursor_ordering.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = const.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = const.MAX_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position_filter(self, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def decode_cursor(self, request, model):
+        """Позиция из курсора со значениями, приведёнными к типам полей."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                self.parse_cursor_value(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_cursor_value(self, model, name, value):
+        """Значение поля модели или целочисленной аннотации из курсора."""
+        if isinstance(value, (bool, dict, list)) or value is None:
+            raise ValueError(value)
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return int(value)
+        return field.to_python(value)
+
+    def encode_cursor(self, obj):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(value)
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.page[-1]),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+def is_cursor_requested(request):
+    return KeysetPagination.cursor_query_param in request.query_params
+
+
+def get_paginator(request):
+    """Пагинатор, выбранный клиентом: по курсору или по номеру страницы."""
+    if is_cursor_requested(request):
+        return KeysetPagination()
+    return CustomPagination()
+
+
+class SelectablePaginationMixin:
+    """Включает пагинацию по курсору, если в запросе передан cursor.
+
+    Первая страница запрашивается с пустым параметром (?cursor=), далее
+    клиент переходит по ссылке next. Без параметра сохраняется обычная
+    постраничная пагинация. Параметры из cursor_incompatible_params
+    задают свой порядок выдачи, поэтому вместе с курсором отклоняются.
+    """
+
+    cursor_incompatible_params = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action != 'list' or not is_cursor_requested(request):
+            return
+        for param in self.cursor_incompatible_params:
+            if request.query_params.get(param):
+                raise ValidationError({
+                    param: 'Параметр нельзя сочетать с cursor, '
+                           'используйте постраничный вывод.'
+                })
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator')
+                and is_cursor_requested(self.request)):
+            self._paginator = KeysetPagination()
+        return super().paginator
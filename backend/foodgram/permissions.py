@@ -1,3 +1,5 @@
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import (
     SAFE_METHODS,
     BasePermission,
@@ -5,6 +7,22 @@ from rest_framework.permissions import (
 )
 
 
+def is_staff_request(request):
+    """Запрос персонала, проверяемый вне представлений DRF.
+
+    Подходит для middleware: пользователь берётся из сессии или
+    определяется по токену из заголовка Authorization.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    try:
+        credentials = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return credentials is not None and credentials[0].is_staff
+
+
 class IsAuthorOrAdminOrReadOnly(IsAuthenticatedOrReadOnly):
     def has_object_permission(self, request, view, obj):
         return (request.method in SAFE_METHODS
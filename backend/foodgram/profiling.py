@@ -0,0 +1,196 @@
+import cProfile
+import json
+import pstats
+import time
+import traceback
+import tracemalloc
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.template.response import SimpleTemplateResponse
+from django.utils import timezone
+from rest_framework.serializers import BaseSerializer
+
+import foodgram.constants as const
+from foodgram import metrics
+from foodgram.permissions import is_staff_request
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+
+
+def code_key(function):
+    """Ключ функции в статистике cProfile."""
+    code = function.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+SERIALIZE_KEY = code_key(BaseSerializer.data.fget)
+RENDER_KEY = code_key(SimpleTemplateResponse.render)
+INSTRUMENTATION_FILES = {__file__, metrics.__file__}
+
+
+def app_stack():
+    """Кадры стека из кода проекта, начиная с ближайшего к SQL."""
+    base_dir = str(settings.BASE_DIR)
+    return [
+        f'{Path(frame.filename).relative_to(base_dir)}:{frame.lineno} '
+        f'in {frame.name}'
+        for frame in reversed(traceback.extract_stack())
+        if frame.filename.startswith(base_dir)
+        and 'site-packages' not in frame.filename
+        and frame.filename not in INSTRUMENTATION_FILES
+    ]
+
+
+class QueryTrace:
+    """Обёртка выполнения SQL, запоминающая запросы, время и место вызова."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params)[:const.PROFILE_PARAMS_MAX_LENGTH],
+                'many': many,
+                'duration_ms': (time.perf_counter() - started) * 1000,
+                'stack': app_stack(),
+            })
+
+    @property
+    def duration_ms(self):
+        return sum(query['duration_ms'] for query in self.queries)
+
+    def report(self):
+        """Запросы с отметками повторов.
+
+        Дубликаты совпадают вместе с параметрами, похожие — только
+        текстом SQL; много похожих запросов обычно означает N+1.
+        """
+        duplicates = Counter(
+            (query['sql'], query['params']) for query in self.queries
+        )
+        similar = Counter(query['sql'] for query in self.queries)
+        for query in self.queries:
+            query['duplicates'] = duplicates[query['sql'], query['params']]
+            query['similar'] = similar[query['sql']]
+        return {
+            'count': len(self.queries),
+            'duration_ms': self.duration_ms,
+            'duplicates': sum(
+                count - 1 for count in duplicates.values() if count > 1
+            ),
+            'similar': sum(
+                count - 1 for count in similar.values() if count > 1
+            ),
+            'statements': self.queries,
+        }
+
+
+def top_functions(stats):
+    return [
+        {
+            'function': pstats.func_std_string(key),
+            'calls': calls,
+            'total_ms': total * 1000,
+            'cumulative_ms': cumulative * 1000,
+        }
+        for key, (_, calls, total, cumulative, _) in sorted(
+            stats.stats.items(), key=lambda item: -item[1][3]
+        )[:const.PROFILE_TOP_FUNCTIONS]
+    ]
+
+
+class ProfilingMiddleware:
+    """Профилирование отдельного запроса по просьбе персонала.
+
+    Запрос с заголовком X-Profile или параметром ?profile выполняется
+    под cProfile и tracemalloc, все SQL-запросы записываются с временем
+    и местом вызова. Статистика cProfile и отчёт в JSON сохраняются
+    в PROFILING_DIR, сводка отдаётся в заголовке Server-Timing, имя
+    файлов — в X-Profile-Id. Остальные запросы обрабатываются как обычно.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            PROFILE_HEADER not in request.META
+            and PROFILE_PARAM not in request.GET
+        ) or not is_staff_request(request):
+            return self.get_response(request)
+        return self.profile(request)
+
+    def strip_flag(self, request):
+        """Убирает ?profile, чтобы запрос прошёл тем же путём."""
+        if PROFILE_PARAM in request.GET:
+            request.GET = request.GET.copy()
+            del request.GET[PROFILE_PARAM]
+            request.GET._mutable = False
+            request.META['QUERY_STRING'] = request.GET.urlencode()
+
+    def profile(self, request):
+        self.strip_flag(request)
+        trace = QueryTrace()
+        profiler = cProfile.Profile()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(trace):
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            total_ms = (time.perf_counter() - started) * 1000
+            _, memory_peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+        stats = pstats.Stats(profiler)
+        timings = {
+            'db': trace.duration_ms,
+            'serialize': stats.stats.get(SERIALIZE_KEY, (0,) * 4)[3] * 1000,
+            'render': stats.stats.get(RENDER_KEY, (0,) * 4)[3] * 1000,
+            'total': total_ms,
+        }
+        name = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(directory / f'{name}.prof')
+        match = request.resolver_match
+        report = {
+            'id': name,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'route': match.view_name if match else None,
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'timings_ms': timings,
+            'memory_peak_bytes': memory_peak,
+            'queries': trace.report(),
+            'functions': top_functions(stats),
+        }
+        with open(directory / f'{name}.json', 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timings["db"]:.1f};desc="{len(trace.queries)} queries"',
+            f'serialize;dur={timings["serialize"]:.1f}',
+            f'render;dur={timings["render"]:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ))
+        response['X-Profile-Id'] = name
+        return response
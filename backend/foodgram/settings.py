@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 
 import django_filters
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 import foodgram.constants as const
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_filters',
@@ -34,11 +36,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,6 +81,27 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': const.PAGE_SIZE,
 }
 
+PAGINATION_COUNT_STRATEGY = os.getenv('PAGINATION_COUNT_STRATEGY', 'exact')
+PAGINATION_COUNT_CACHE_TIMEOUT = int(os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 30))
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD', 10000))
+
+# Как часто процесс сверяет индекс автодополнения с версией ингредиентов.
+INGREDIENT_INDEX_CHECK_INTERVAL = float(os.getenv('INGREDIENT_INDEX_CHECK_INTERVAL', 5))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+FEED_FAN_OUT_WORKERS = int(os.getenv('FEED_FAN_OUT_WORKERS', 1))
+FEED_CELEBRITY_FOLLOWERS = int(os.getenv('FEED_CELEBRITY_FOLLOWERS', 10000))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
@@ -88,6 +113,51 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'responses'),
+    },
+    # Версии данных сбрасывают ETag и кеши ответов во всех процессах,
+    # поэтому кеш версий обязан быть общим: БД (manage.py createcachetable)
+    # или Redis. Вытесненная версия возвращается к начальной и открывает
+    # устаревшие записи кешей, поэтому вытеснения быть не должно:
+    # MAX_ENTRIES таблицы заведомо больше числа ключей, Redis — с
+    # maxmemory-policy noeviction.
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSION_CACHE_BACKEND',
+            'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': os.getenv('VERSION_CACHE_LOCATION', 'foodgram_versions'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('VERSION_CACHE_MAX_ENTRIES', 10**12)),
+        },
+    },
+}
+
+VERSION_CACHE_ALIAS = 'versions'
+if not DEBUG and CACHES[VERSION_CACHE_ALIAS]['BACKEND'] in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+):
+    raise ImproperlyConfigured(
+        'VERSION_CACHE_BACKEND должен быть общим для всех процессов'
+    )
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
 AUTH_USER_MODEL = 'users.User'
 
 DJOSER = {
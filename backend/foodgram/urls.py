@@ -2,9 +2,12 @@ from django.contrib import admin
 from django.urls import path
 from django.urls.conf import include
 
+from foodgram.metrics import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('djoser.urls.authtoken')),
+    path('api/metrics', MetricsView.as_view()),
     path('api/', include('users.urls')),
     path('api/', include('recipes.urls')),
 ]
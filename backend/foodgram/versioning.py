@@ -0,0 +1,62 @@
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY = 'foodgram:version:{}'
+RECIPES_VERSION = 'recipes'
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+USERS_VERSION = 'users'
+AUTHORS_VERSION = 'authors'
+FEED_VERSION = 'feed'
+SIMILAR_VERSION = 'similar'
+# Версия набора данных, который ещё ни разу не менялся.
+VERSION_EPOCH = 0.0
+
+
+def recipe_version(recipe_id):
+    """Имя версии отдельного рецепта."""
+    return f'recipe:{recipe_id}'
+
+
+def user_version(user_id):
+    """Имя версии личных данных пользователя: избранного, покупок, подписок."""
+    return f'user:{user_id}'
+
+
+def version_cache():
+    """Кеш версий, общий для всех процессов и серверов."""
+    return caches[settings.VERSION_CACHE_ALIAS]
+
+
+def set_version(name):
+    version_cache().set(VERSION_KEY.format(name), time.time(), timeout=None)
+
+
+def bump_version(name):
+    """Помечает набор данных name изменённым.
+
+    Версия меняется после фиксации текущей транзакции: до этого другие
+    процессы видят старые данные и не должны кешировать их под новой
+    версией.
+    """
+    transaction.on_commit(partial(set_version, name))
+
+
+def get_versions(names):
+    """Текущие версии наборов данных names одним обращением к кешу.
+
+    Чтение ничего не записывает: версия, которую ещё не меняли, равна
+    VERSION_EPOCH, поэтому ключи заводятся только в bump_version.
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = version_cache().get_many(keys)
+    return [versions.get(key, VERSION_EPOCH) for key in keys]
+
+
+def get_version(name):
+    """Текущая версия набора данных name, общая для всех процессов."""
+    return get_versions((name,))[0]
@@ -0,0 +1,22 @@
+import os
+import shutil
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+
+def on_starting(server):
+    """Очищает каталог метрик от файлов прошлого запуска."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Убирает из метрик показатели-снимки завершившегося воркера."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid, PROMETHEUS_MULTIPROC_DIR)
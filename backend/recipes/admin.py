@@ -1,9 +1,33 @@
 from django.contrib.admin.decorators import register
 from django.contrib.admin.options import ModelAdmin, TabularInline
 from django.contrib.admin.sites import site
+from django.db import transaction
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredients,
                      RecipeTags, ShoppingCart, Tag)
+from .payloads import INGREDIENTS_PAYLOAD, TAGS_PAYLOAD
+from .shopping_list import get_recipe_ingredients, replace_recipe_ingredients
+
+
+class PayloadAdminMixin:
+    """Пересобирает готовый ответ справочника после правки в админке."""
+
+    payload = None
+
+    def rebuild_payload(self):
+        transaction.on_commit(self.payload.build)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.rebuild_payload()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.rebuild_payload()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self.rebuild_payload()
 
 
 class RecipeIngredientsInline(TabularInline):
@@ -26,6 +50,8 @@ class RecipeAdmin(ModelAdmin):
         'id',
         'name',
         'author',
+        'favorites_count',
+        'in_carts_count',
     )
     list_filter = (
         'author',
@@ -33,9 +59,21 @@ class RecipeAdmin(ModelAdmin):
         'tags'
     )
 
+    def save_related(self, request, form, formsets, change):
+        # Инлайн меняет состав мимо сериализатора, поэтому суммарные
+        # списки покупок с этим рецептом пересчитываются здесь.
+        recipe = form.instance
+        old_ingredients = get_recipe_ingredients(recipe.pk) if change else []
+        super().save_related(request, form, formsets, change)
+        if change:
+            replace_recipe_ingredients(
+                recipe, old_ingredients, get_recipe_ingredients(recipe.pk)
+            )
+
 
 @register(Ingredient)
-class IngredientAdmin(ModelAdmin):
+class IngredientAdmin(PayloadAdminMixin, ModelAdmin):
+    payload = INGREDIENTS_PAYLOAD
     list_display = (
         'id',
         'name',
@@ -47,7 +85,8 @@ class IngredientAdmin(ModelAdmin):
 
 
 @register(Tag)
-class TagAdmin(ModelAdmin):
+class TagAdmin(PayloadAdminMixin, ModelAdmin):
+    payload = TAGS_PAYLOAD
     list_display = (
         'id',
         'name',
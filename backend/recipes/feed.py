@@ -0,0 +1,205 @@
+import heapq
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from rest_framework.utils.urls import replace_query_param
+
+import foodgram.constants as const
+from foodgram.pagination import KeysetPagination
+from foodgram.utils import batched
+from foodgram.versioning import FEED_VERSION, bump_version
+from users.models import Follow
+from .models import Recipe, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+FeedKey = namedtuple('FeedKey', ('pub_date', 'id'))
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.FEED_FAN_OUT_WORKERS,
+    thread_name_prefix='feed-fan-out',
+)
+
+
+def add_to_timelines(user_ids, recipes):
+    """Записывает рецепты (id, автор, дата) в ленты пользователей пачками."""
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            recipe_id=recipe_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in user_ids
+        for recipe_id, author_id, pub_date in recipes
+    )
+    for batch in batched(entries, const.FEED_FAN_OUT_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fanned_out_recipes():
+    """Рецепты авторов, которые рассылаются по лентам при записи.
+
+    Рецепты знаменитостей с FEED_CELEBRITY_FOLLOWERS подписчиков и более
+    не копируются в ленты, а подмешиваются при чтении.
+    """
+    return Recipe.objects.filter(
+        author__followers_count__lt=settings.FEED_CELEBRITY_FOLLOWERS
+    ).values_list('pk', 'author_id', 'pub_date')
+
+
+def latest_recipes(author_id):
+    return fanned_out_recipes().filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    )[:const.FEED_BACKFILL_LIMIT]
+
+
+def fan_out(recipe_ids):
+    """Добавляет новые рецепты в ленты подписчиков их авторов."""
+    for recipe in fanned_out_recipes().filter(pk__in=recipe_ids):
+        followers = Follow.objects.filter(author_id=recipe[1]).values_list(
+            'user_id', flat=True
+        )
+        try:
+            add_to_timelines(list(followers), (recipe,))
+        except IntegrityError:
+            # Рецепт удалён, пока шла рассылка.
+            continue
+    bump_version(FEED_VERSION)
+
+
+def backfill_followers(author_id):
+    """Добавляет последние рецепты автора в ленты всех его подписчиков."""
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+    add_to_timelines(list(followers), list(latest_recipes(author_id)))
+    bump_version(FEED_VERSION)
+
+
+def run_task(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception(
+            'Не удалось обновить ленты: %s%s', task.__name__, args
+        )
+    finally:
+        connection.close()
+
+
+def schedule_task(task, *args):
+    """Ставит обновление лент в очередь после фиксации транзакции."""
+    transaction.on_commit(partial(_executor.submit, run_task, task, *args))
+
+
+def schedule_fan_out(recipe_ids):
+    schedule_task(fan_out, list(recipe_ids))
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора при подписке."""
+    add_to_timelines((user_id,), list(latest_recipes(author_id)))
+
+
+def follower_removed(author_id):
+    """Возвращает автора к рассылке, если он перестал быть знаменитостью.
+
+    Рецепты, опубликованные, пока у автора было FEED_CELEBRITY_FOLLOWERS
+    подписчиков и более, в ленты не копировались; после отписки, которая
+    опускает число подписчиков ниже порога, последние рецепты автора
+    добавляются в ленты всех подписчиков. Подписчики считаются в базе и
+    не дальше порога, чтобы не пересчитывать всех подписчиков знаменитости.
+    """
+    threshold = settings.FEED_CELEBRITY_FOLLOWERS
+    followers = Follow.objects.filter(author_id=author_id).order_by()
+    if followers[:threshold].count() == threshold - 1:
+        schedule_task(backfill_followers, author_id)
+
+
+def remove_from_timeline(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def read_page(queryset, key_field, position, limit):
+    if position is not None:
+        pub_date, recipe_id = position
+        queryset = queryset.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, **{f'{key_field}__lt': recipe_id})
+        )
+    return [
+        FeedKey(*row)
+        for row in queryset.order_by('-pub_date', f'-{key_field}')[:limit]
+    ]
+
+
+def get_feed_keys(user, position, limit):
+    """Ключи (дата, id рецепта) страницы ленты после позиции position.
+
+    Собственная лента пользователя читается одним проходом по индексу,
+    рецепты знаменитостей из подписок — по индексу автора; результаты
+    сливаются с удалением повторов, которые остаются в лентах у автора,
+    ставшего знаменитостью.
+    """
+    pages = [read_page(
+        TimelineEntry.objects.filter(user=user).values_list(
+            'pub_date', 'recipe_id'
+        ),
+        'recipe_id',
+        position,
+        limit,
+    )]
+    celebrities = list(Follow.objects.filter(
+        user=user,
+        author__followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+    if celebrities:
+        pages.append(read_page(
+            Recipe.objects.filter(author_id__in=celebrities).values_list(
+                'pub_date', 'id'
+            ),
+            'id',
+            position,
+            limit,
+        ))
+    keys = []
+    for key in heapq.merge(*pages, reverse=True):
+        if keys and keys[-1] == key:
+            continue
+        keys.append(key)
+        if len(keys) == limit:
+            break
+    return keys
+
+
+class FeedPagination(KeysetPagination):
+    """Пагинация ленты подписок по курсору из даты и id рецепта."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        keys = get_feed_keys(
+            request.user,
+            self.decode_cursor(request, queryset.model),
+            self.page_size + 1,
+        )
+        self.has_next = len(keys) > self.page_size
+        self.keys = keys[:self.page_size]
+        recipes = queryset.in_bulk([key.id for key in self.keys])
+        self.page = [recipes[key.id] for key in self.keys if key.id in recipes]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.keys[-1]),
+        )
@@ -1,3 +1,10 @@
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db import connections
+from django.db.models import F, Q
 from django_filters import rest_framework as filters
 
 from .models import Ingredient, Recipe, Tag
@@ -13,10 +20,17 @@ class RecipeFilter(filters.FilterSet):
     is_in_shopping_cart = filters.CharFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+        ]
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -30,6 +44,25 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shoppingcart__user=user)
         return queryset.all()
 
+    def get_search(self, queryset, name, value):
+        """Поиск по названию и описанию с сортировкой по релевантности.
+
+        На PostgreSQL используются полнотекстовый поиск по search_vector
+        и триграммное сходство названия, оба покрыты GIN-индексами.
+        На остальных СУБД выполняется простой поиск по вхождению.
+        """
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).annotate(
+            rank=(SearchRank(F('search_vector'), query)
+                  + TrigramSimilarity('name', value)),
+        ).order_by('-rank', '-pub_date')
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(field_name='name', lookup_expr='icontains')
@@ -0,0 +1,149 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+import foodgram.constants as const
+from foodgram.versioning import RECIPES_VERSION, bump_version, recipe_version
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/variants'
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+# AVIF доступен только со сборкой Pillow или плагином, которые его пишут.
+Image.init()
+if 'AVIF' in Image.SAVE:
+    FORMATS['avif'] = ('AVIF', 'avif')
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+def needs_processing(recipe):
+    """Варианты отсутствуют, собраны для другого файла или фото удалено."""
+    return recipe.image_variants.get('source') != (recipe.image.name or None)
+
+
+def encode(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(
+        buffer,
+        image_format,
+        quality=const.IMAGE_VARIANT_QUALITY,
+        optimize=image_format == 'JPEG',
+    )
+    return buffer.getvalue()
+
+
+def make_variants(recipe_id, source):
+    """Сохраняет уменьшенные копии source во всех форматах.
+
+    Возвращает размеры оригинала и описание вариантов с именами файлов
+    в хранилище.
+    """
+    stem = posixpath.splitext(posixpath.basename(source))[0]
+    with default_storage.open(source) as file, Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        width, height = image.size
+        variants = {'source': source}
+        for name, size in const.IMAGE_VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            files = {}
+            for key, (image_format, extension) in FORMATS.items():
+                path = posixpath.join(
+                    VARIANTS_DIR, str(recipe_id), f'{stem}_{name}.{extension}'
+                )
+                if default_storage.exists(path):
+                    default_storage.delete(path)
+                files[key] = default_storage.save(
+                    path, ContentFile(encode(resized, image_format))
+                )
+            variants[name] = {
+                'width': resized.width,
+                'height': resized.height,
+                'files': files,
+            }
+    return width, height, variants
+
+
+def variant_files(variants):
+    return {
+        path
+        for name, variant in variants.items() if name != 'source'
+        for path in variant['files'].values()
+    }
+
+
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def process_recipe_image(recipe_id):
+    """Собирает варианты фото рецепта и записывает их в базу.
+
+    Запись выполняется только если фото не сменилось за время обработки,
+    иначе результат отбрасывается: новое фото обработает своя задача.
+    Если фото удалено, удаляются и варианты.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_variants'
+    ).first()
+    if recipe is None or not needs_processing(recipe):
+        return False
+    source = recipe.image.name
+    if source:
+        width, height, variants = make_variants(recipe_id, source)
+    else:
+        width, height, variants = None, None, {}
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_width=width,
+        image_height=height,
+        image_variants=variants,
+    )
+    old_files = variant_files(recipe.image_variants)
+    new_files = variant_files(variants)
+    delete_files(old_files - new_files if updated else new_files - old_files)
+    if updated:
+        bump_version(RECIPES_VERSION)
+        bump_version(recipe_version(recipe_id))
+    return bool(updated)
+
+
+def schedule_variants_deletion(variants):
+    """Удаляет файлы вариантов фото после фиксации транзакции."""
+    paths = variant_files(variants)
+    if paths:
+        transaction.on_commit(partial(_executor.submit, delete_files, paths))
+
+
+def run_task(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_image_processing(recipe_id):
+    """Ставит обработку фото в очередь после фиксации транзакции."""
+    transaction.on_commit(partial(_executor.submit, run_task, recipe_id))
@@ -0,0 +1,85 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from foodgram.versioning import INGREDIENTS_VERSION, get_version
+from .models import Ingredient
+
+
+def normalize(value):
+    return value.strip().lower().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов для автодополнения.
+
+    Поиск по префиксу выполняется бинарным поиском, совпадения в начале
+    слова и внутри названия добираются линейным проходом по индексу.
+    """
+
+    def __init__(self, ingredients):
+        rows = sorted(
+            ((normalize(item['name']), item) for item in ingredients),
+            key=lambda row: row[0],
+        )
+        self.keys = [key for key, _ in rows]
+        self.items = [item for _, item in rows]
+
+    def search(self, query, limit=None):
+        query = normalize(query)
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + '\uffff')
+        results = self.items[start:end][:limit]
+        if limit is not None and len(results) >= limit:
+            return results
+        word_matches = []
+        substring_matches = []
+        word_query = ' ' + query
+        for position, key in enumerate(self.keys):
+            if start <= position < end or query not in key:
+                continue
+            if word_query in key:
+                word_matches.append(self.items[position])
+            else:
+                substring_matches.append(self.items[position])
+        results += word_matches + substring_matches
+        return results[:limit]
+
+
+IndexState = namedtuple('IndexState', ('index', 'version', 'checked'))
+
+_index_lock = threading.Lock()
+_index = {}
+
+
+def get_index_state():
+    """Индекс текущего процесса и версия ингредиентов, по которой он собран.
+
+    Версия читается из общего кеша не чаще раза в
+    INGREDIENT_INDEX_CHECK_INTERVAL секунд, поэтому между проверками
+    автодополнение не обращается ни к базе, ни к кешу версий.
+    """
+    interval = settings.INGREDIENT_INDEX_CHECK_INTERVAL
+    state = _index.get('state')
+    if state is not None and time.monotonic() - state.checked < interval:
+        return state
+    with _index_lock:
+        state = _index.get('state')
+        if state is not None and time.monotonic() - state.checked < interval:
+            return state
+        version = get_version(INGREDIENTS_VERSION)
+        if state is None or state.version != version:
+            index = IngredientIndex(
+                Ingredient.objects.values('id', 'name', 'measurement_unit')
+            )
+        else:
+            index = state.index
+        state = _index['state'] = IndexState(index, version, time.monotonic())
+    return state
+
+
+def get_ingredient_index():
+    return get_index_state().index
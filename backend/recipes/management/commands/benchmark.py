@@ -0,0 +1,296 @@
+import base64
+import json
+import resource
+import subprocess
+import time
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import Follow, User
+
+# (название, метод, путь, тело запроса, анонимный ли запрос)
+ROUTES = (
+    ('tags', 'get', '/api/tags/', None, False),
+    ('ingredients', 'get', '/api/ingredients/', None, False),
+    ('ingredients-search', 'get', '/api/ingredients/?name=сол', None, False),
+    ('recipes', 'get', '/api/recipes/', None, False),
+    ('recipes-anonymous', 'get', '/api/recipes/', None, True),
+    ('recipes-page-50', 'get', '/api/recipes/?page=50', None, False),
+    ('recipes-cursor', 'get', '/api/recipes/?cursor=', None, False),
+    ('recipes-tags', 'get', '/api/recipes/?tags={tag}', None, False),
+    ('recipes-author', 'get', '/api/recipes/?author={author}', None, False),
+    ('recipes-favorited', 'get', '/api/recipes/?is_favorited=1', None,
+     False),
+    ('recipes-in-cart', 'get', '/api/recipes/?is_in_shopping_cart=1', None,
+     False),
+    ('recipes-search', 'get', '/api/recipes/?search=суп', None, False),
+    ('recipe', 'get', '/api/recipes/{recipe}/', None, False),
+    ('similar', 'get', '/api/recipes/{recipe}/similar/', None, False),
+    ('feed', 'get', '/api/recipes/feed/', None, False),
+    ('users', 'get', '/api/users/', None, False),
+    ('user', 'get', '/api/users/{author}/', None, False),
+    ('users-me', 'get', '/api/users/me/', None, False),
+    ('subscriptions', 'get', '/api/users/subscriptions/?recipes_limit=3',
+     None, False),
+    ('shopping-list-txt', 'get',
+     '/api/recipes/download_shopping_cart/?format=txt', None, False),
+    ('shopping-list-pdf', 'get',
+     '/api/recipes/download_shopping_cart/?format=pdf', None, False),
+    ('favorite-add', 'post', '/api/recipes/{recipe}/favorite/', None, False),
+    ('favorite-remove', 'delete', '/api/recipes/{recipe}/favorite/', None,
+     False),
+    ('cart-add', 'post', '/api/recipes/{recipe}/shopping_cart/', None,
+     False),
+    ('cart-remove', 'delete', '/api/recipes/{recipe}/shopping_cart/', None,
+     False),
+    ('subscribe', 'post', '/api/users/{author}/subscribe/', None, False),
+    ('unsubscribe', 'delete', '/api/users/{author}/subscribe/', None, False),
+    ('recipe-create', 'post', '/api/recipes/', 'recipe', False),
+    ('recipe-update', 'patch', '/api/recipes/{created}/', 'recipe', False),
+    ('recipe-delete', 'delete', '/api/recipes/{created}/', None, False),
+)
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[rank]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержек и числа запросов к БД для всех маршрутов API '
+        'тестовым клиентом Django или по HTTP к запущенному серверу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера, например http://127.0.0.1:8000',
+        )
+        parser.add_argument(
+            '--server-pid',
+            type=int,
+            help='PID сервера для замера пикового RSS в режиме --url',
+        )
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, от имени которого идут запросы',
+        )
+        parser.add_argument(
+            '--route',
+            action='append',
+            help='Замерять только указанные маршруты',
+        )
+        parser.add_argument('--output', help='Файл для результата в JSON')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.context = self.get_context(user)
+        self.body = self.get_recipe_body()
+        routes = [
+            route for route in ROUTES
+            if not options['route'] or route[0] in options['route']
+        ]
+        if options['url']:
+            session = requests.Session()
+            self.send = self.http_sender(session, options['url'], token.key)
+        else:
+            self.send = self.client_sender(token.key)
+        samples = {route[0]: [] for route in routes}
+        for iteration in range(options['warmup'] + options['iterations']):
+            for route in routes:
+                sample = self.run_route(*route)
+                if iteration >= options['warmup']:
+                    samples[route[0]].append(sample)
+        report = self.build_report(samples, options)
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            top = Follow.objects.values('user').annotate(
+                total=Count('pk')
+            ).order_by('-total').first()
+            user = User.objects.filter(
+                pk=top['user'] if top else None
+            ).first() or User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, выполните generate_fixtures'
+            )
+        return user
+
+    def get_context(self, user):
+        """Значения для подстановки в пути маршрутов.
+
+        Рецепт и автор выбираются среди популярных, но ещё не добавленных
+        пользователем, чтобы пары добавления и удаления проходили успешно.
+        """
+        recipe = Recipe.objects.exclude(favorite__user=user).exclude(
+            shoppingcart__user=user
+        ).order_by('-favorites_count', 'pk').first()
+        author = User.objects.exclude(pk=user.pk).exclude(
+            following__user=user
+        ).order_by('-recipes_count', 'pk').first()
+        if recipe is None or author is None:
+            raise CommandError(
+                'Недостаточно данных, выполните generate_fixtures'
+            )
+        return {
+            'recipe': recipe.pk,
+            'author': author.pk,
+            'tag': Tag.objects.order_by('pk').values_list(
+                'slug', flat=True
+            ).first(),
+            'created': None,
+        }
+
+    def get_recipe_body(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), '#56ccf2').save(buffer, 'PNG')
+        return {
+            'name': 'Замер производительности',
+            'text': 'Рецепт, созданный командой benchmark',
+            'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in Ingredient.objects.values_list(
+                    'pk', flat=True
+                )[:8]
+            ],
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                buffer.getvalue()
+            ).decode(),
+        }
+
+    def client_sender(self, token):
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if host != '*'),
+            'localhost',
+        )
+        client = Client(raise_request_exception=False, HTTP_HOST=host)
+
+        def send(method, path, body, anonymous):
+            kwargs = {} if anonymous else {
+                'HTTP_AUTHORIZATION': f'Token {token}'
+            }
+            if method != 'get':
+                kwargs['data'] = json.dumps(body) if body else ''
+                kwargs['content_type'] = 'application/json'
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, len(queries), (
+                None if response.streaming else response.content
+            )
+
+        return send
+
+    def http_sender(self, session, url, token):
+        def send(method, path, body, anonymous):
+            headers = {} if anonymous else {
+                'Authorization': f'Token {token}'
+            }
+            started = time.perf_counter()
+            response = session.request(
+                method, url.rstrip('/') + path, json=body, headers=headers
+            )
+            elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, None, response.content
+
+        return send
+
+    def run_route(self, name, method, path, body, anonymous):
+        status, elapsed, queries, content = self.send(
+            method,
+            path.format(**self.context),
+            self.body if body else None,
+            anonymous,
+        )
+        if name == 'recipe-create' and status == 201:
+            self.context['created'] = json.loads(content)['id']
+        return {'status': status, 'time': elapsed, 'queries': queries}
+
+    def peak_rss_kb(self, server_pid):
+        if server_pid is None:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with open(f'/proc/{server_pid}/status', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+        return None
+
+    def build_report(self, samples, options):
+        routes = {}
+        for name, route_samples in samples.items():
+            if not route_samples:
+                continue
+            times = [sample['time'] * 1000 for sample in route_samples]
+            queries = [
+                sample['queries'] for sample in route_samples
+                if sample['queries'] is not None
+            ]
+            routes[name] = {
+                'p50_ms': round(percentile(times, 50), 3),
+                'p95_ms': round(percentile(times, 95), 3),
+                'p99_ms': round(percentile(times, 99), 3),
+                'mean_ms': round(sum(times) / len(times), 3),
+                'queries': max(queries) if queries else None,
+                'statuses': sorted({
+                    sample['status'] for sample in route_samples
+                }),
+            }
+        server_pid = options['server_pid']
+        return {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'mode': 'http' if options['url'] else 'client',
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'peak_rss_kb': (
+                self.peak_rss_kb(server_pid)
+                if server_pid or not options['url'] else None
+            ),
+            'routes': routes,
+        }
@@ -0,0 +1,180 @@
+import gzip
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import get_current_timezone, is_naive, make_aware
+
+from foodgram.utils import batched
+from recipes.models import (Favorite, Recipe, RecipeIngredients, RecipeTags,
+                            ShoppingCart)
+from users.models import Follow, User
+
+USER_FIELDS = (
+    'id',
+    'email',
+    'username',
+    'first_name',
+    'last_name',
+    'date_joined',
+    'recipes_count',
+    'followers_count',
+)
+RECIPE_FIELDS = (
+    'id',
+    'name',
+    'text',
+    'cooking_time',
+    'image',
+    'pub_date',
+    'author_id',
+    'author__email',
+    'favorites_count',
+    'in_carts_count',
+)
+
+
+def parse_since(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f'Некорректная дата --since: {value}')
+        moment = parse_datetime(f'{date.isoformat()}T00:00:00')
+    if is_naive(moment):
+        moment = make_aware(moment, get_current_timezone())
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка данных в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            type=Path,
+            help='Каталог, в который записываются файлы выгрузки',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Сжимать файлы gzip',
+        )
+        parser.add_argument(
+            '--since',
+            type=parse_since,
+            help=(
+                'Выгрузить только рецепты и пользователей, созданных '
+                'начиная с даты; таблицы связей выгружаются целиком'
+            ),
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк, читаемых с сервера за раз',
+        )
+
+    def handle(self, *args, **options):
+        options['output'].mkdir(parents=True, exist_ok=True)
+        self.chunk_size = options['chunk_size']
+        since = options['since']
+        users = User.objects.order_by('pk')
+        recipes = Recipe.objects.order_by('pk')
+        if since is not None:
+            users = users.filter(date_joined__gte=since)
+            recipes = recipes.filter(pub_date__gte=since)
+        exports = (
+            ('users', self.iter_rows(users.values(*USER_FIELDS))),
+            ('recipes', self.iter_recipes(recipes.values(*RECIPE_FIELDS))),
+            ('follows', self.iter_rows(
+                Follow.objects.order_by('pk').values('user_id', 'author_id')
+            )),
+            ('favorites', self.iter_rows(
+                Favorite.objects.order_by('pk').values('user_id', 'recipe_id')
+            )),
+            ('shopping_carts', self.iter_rows(
+                ShoppingCart.objects.order_by('pk').values(
+                    'user_id', 'recipe_id'
+                )
+            )),
+        )
+        with transaction.atomic():
+            self.start_snapshot()
+            for name, rows in exports:
+                self.export(name, rows, options)
+        self.stdout.write(self.style.SUCCESS('Выгрузка завершена'))
+
+    def start_snapshot(self):
+        """Все таблицы читаются из одного снимка базы.
+
+        В PostgreSQL по умолчанию READ COMMITTED, и каждый запрос видит
+        свой снимок, поэтому уровень изоляции повышается до REPEATABLE
+        READ первой командой транзакции.
+        """
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY'
+                )
+
+    def export(self, name, rows, options):
+        started = time.monotonic()
+        path = options['output'] / f'{name}.ndjson'
+        if options['gzip']:
+            path = path.with_suffix('.ndjson.gz')
+            file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            file = open(path, 'w', encoding='utf-8')
+        with file:
+            count = 0
+            for row in rows:
+                file.write(json.dumps(
+                    row, cls=DjangoJSONEncoder, ensure_ascii=False
+                ))
+                file.write('\n')
+                count += 1
+        self.stdout.write(
+            f'{path}: {count} строк за '
+            f'{time.monotonic() - started:.1f} с'
+        )
+
+    def iter_rows(self, queryset):
+        """Строки запроса, читаемые серверным курсором порциями."""
+        return queryset.iterator(chunk_size=self.chunk_size)
+
+    def iter_recipes(self, queryset):
+        """Рецепты с тегами и ингредиентами, догружаемыми на порцию."""
+        for chunk in batched(self.iter_rows(queryset), self.chunk_size):
+            recipe_ids = [recipe['id'] for recipe in chunk]
+            tags = defaultdict(list)
+            for recipe_id, slug in RecipeTags.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', 'tag__slug'):
+                tags[recipe_id].append(slug)
+            ingredients = defaultdict(list)
+            for recipe_id, name, unit, amount in (
+                RecipeIngredients.objects.filter(
+                    recipe_id__in=recipe_ids
+                ).values_list(
+                    'recipe_id',
+                    'ingredient__name',
+                    'ingredient__measurement_unit',
+                    'amount',
+                )
+            ):
+                ingredients[recipe_id].append({
+                    'name': name,
+                    'measurement_unit': unit,
+                    'amount': amount,
+                })
+            for recipe in chunk:
+                recipe['author'] = recipe.pop('author__email')
+                recipe['tags'] = tags[recipe['id']]
+                recipe['ingredients'] = ingredients[recipe['id']]
+                yield recipe
@@ -0,0 +1,221 @@
+import random
+import time
+from io import BytesIO
+from itertools import accumulate
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from foodgram.counters import get_counters, reconcile_counters
+from foodgram.utils import batched
+from foodgram.versioning import (AUTHORS_VERSION, RECIPES_VERSION,
+                                 USERS_VERSION, bump_version)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            RecipeTags, ShoppingCart, Tag)
+from users.models import Follow, User
+
+PASSWORD = 'fixture-password'
+IMAGE_NAME = 'recipes/images/fixture.png'
+WORDS = (
+    'суп', 'салат', 'пирог', 'запеканка', 'рагу', 'каша', 'омлет',
+    'паста', 'плов', 'оладьи', 'котлеты', 'рулет', 'десерт', 'соус',
+)
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для random.choices."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Среднее число рецептов в избранном пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в корзине пользователя',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--prefix', default='fixture',
+            help='Префикс имён создаваемых пользователей',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)
+        )
+        if not (self.tag_ids and self.ingredient_ids):
+            raise CommandError('Сначала выполните import_data')
+        if User.objects.filter(
+            username__startswith=f'{options["prefix"]}-'
+        ).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть'
+            )
+        started = time.monotonic()
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'], options['prefix'])
+            recipe_ids = self.create_recipes(options['recipes'], user_ids)
+            self.create_relations(
+                Follow, 'author_id', user_ids, user_ids, options['follows']
+            )
+            self.create_relations(
+                Favorite, 'recipe_id', user_ids, recipe_ids,
+                options['favorites'],
+            )
+            self.create_relations(
+                ShoppingCart, 'recipe_id', user_ids, recipe_ids,
+                options['carts'],
+            )
+            self.reset_sequences()
+            reconcile_counters(get_counters(apps))
+            bump_version(USERS_VERSION)
+            bump_version(RECIPES_VERSION)
+            bump_version(AUTHORS_VERSION)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        call_command('update_similar_recipes', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+    def bulk_create(self, model, objects):
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+
+    def create_users(self, count, prefix):
+        password = make_password(PASSWORD)
+        first_id = self.next_id(User)
+        user_ids = list(range(first_id, first_id + count))
+        self.bulk_create(User, (
+            User(
+                pk=pk,
+                username=f'{prefix}-{pk}',
+                email=f'{prefix}-{pk}@example.com',
+                first_name='Имя',
+                last_name=f'Фамилия {pk}',
+                password=password,
+            )
+            for pk in user_ids
+        ))
+        return user_ids
+
+    def placeholder_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (640, 480), '#f2c94c').save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
+
+    def create_recipes(self, count, user_ids):
+        """Рецепты с авторами, тегами и ингредиентами по закону Ципфа.
+
+        Немногие авторы пишут большую часть рецептов, популярные
+        ингредиенты встречаются намного чаще редких.
+        """
+        image = self.placeholder_image()
+        authors = self.random.sample(user_ids, len(user_ids))
+        author_weights = zipf_weights(len(authors), self.skew)
+        ingredient_weights = zipf_weights(len(self.ingredient_ids), self.skew)
+        first_id = self.next_id(Recipe)
+        recipe_ids = list(range(first_id, first_id + count))
+        choose = self.random.choices
+        recipes, tags, ingredients = [], [], []
+        for pk in recipe_ids:
+            recipes.append(Recipe(
+                pk=pk,
+                author_id=choose(authors, cum_weights=author_weights)[0],
+                name=f'{self.random.choice(WORDS)} №{pk}',
+                text=' '.join(choose(WORDS, k=40)),
+                cooking_time=self.random.randint(5, 180),
+                image=image,
+            ))
+            for tag_id in self.random.sample(
+                self.tag_ids, self.random.randint(1, len(self.tag_ids))
+            ):
+                tags.append(RecipeTags(recipe_id=pk, tag_id=tag_id))
+            for ingredient_id in set(choose(
+                self.ingredient_ids,
+                cum_weights=ingredient_weights,
+                k=self.random.randint(3, 15),
+            )):
+                ingredients.append(RecipeIngredients(
+                    recipe_id=pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                ))
+            if len(recipes) >= self.batch_size:
+                self.flush_recipes(recipes, tags, ingredients)
+        self.flush_recipes(recipes, tags, ingredients)
+        return recipe_ids
+
+    def flush_recipes(self, recipes, tags, ingredients):
+        for model, objects in (
+            (Recipe, recipes),
+            (RecipeTags, tags),
+            (RecipeIngredients, ingredients),
+        ):
+            model.objects.bulk_create(objects)
+            objects.clear()
+
+    def create_relations(self, model, target_field, user_ids, targets,
+                         average):
+        """Связи пользователей с популярными целями.
+
+        Число связей пользователя распределено экспоненциально со средним
+        average, цели выбираются по закону Ципфа.
+        """
+        ranked = self.random.sample(targets, len(targets))
+        weights = zipf_weights(len(ranked), self.skew)
+        self.bulk_create(model, (
+            model(user_id=user_id, **{target_field: target})
+            for user_id in user_ids
+            for target in set(self.random.choices(
+                ranked,
+                cum_weights=weights,
+                k=int(self.random.expovariate(1 / average)) if average else 0,
+            ))
+            if target != user_id or model is not Follow
+        ))
+
+    def reset_sequences(self):
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipe]
+            ):
+                cursor.execute(sql)
@@ -1,29 +1,195 @@
 import json
+from collections import Counter
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import slug_re
+from rest_framework.exceptions import ValidationError
 
+import foodgram.constants as const
+from foodgram.validators import validate_hex_color
+from foodgram.utils import batched
+from foodgram.versioning import INGREDIENTS_VERSION, TAGS_VERSION, bump_version
 from recipes.models import Ingredient, Tag
+from recipes.payloads import INGREDIENTS_PAYLOAD, TAGS_PAYLOAD
+
+READ_SIZE = 64 * 1024
+
+
+def skip_whitespace(buffer, line):
+    """Буфер без ведущих пробелов и номер строки после них."""
+    stripped = buffer.lstrip()
+    return stripped, line + buffer.count('\n', 0, len(buffer) - len(stripped))
+
+
+def iter_json_array(file):
+    """Элементы JSON-массива с номерами строк, разбираемые по мере чтения."""
+    decoder = json.JSONDecoder()
+    buffer, line = skip_whitespace(file.read(READ_SIZE), 1)
+    if not buffer.startswith('['):
+        raise CommandError(f'{file.name}: ожидается JSON-массив')
+    buffer = buffer[1:]
+    while True:
+        buffer, line = skip_whitespace(buffer, line)
+        if buffer.startswith(','):
+            buffer, line = skip_whitespace(buffer[1:], line)
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError as error:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError(f'{file.name}:{line}: {error}')
+            buffer += chunk
+            continue
+        yield line, item
+        line += buffer.count('\n', 0, end)
+        buffer = buffer[end:]
+
+
+def iter_rows(file):
+    """Объекты JSON-массива; элемент другого типа прерывает импорт."""
+    for line, row in iter_json_array(file):
+        if not isinstance(row, dict):
+            raise CommandError(f'{file.name}:{line}: ожидается JSON-объект')
+        yield row
+
+
+def is_text(value, max_length):
+    return isinstance(value, str) and 0 < len(value) <= max_length
+
+
+def is_valid_tag(tag):
+    """Поля тега укладываются в длины и форматы модели Tag."""
+    if not (is_text(tag.name, const.MAX_LENGTH_TAG_NAME)
+            and is_text(tag.color, const.MAX_LENGTH_TAG_COLOR)
+            and is_text(tag.slug, const.MAX_LENGTH_TAG_SLUG)
+            and slug_re.match(tag.slug)):
+        return False
+    try:
+        validate_hex_color(tag.color)
+    except ValidationError:
+        return False
+    return True
 
 
 class Command(BaseCommand):
-    help = 'Импорт данных в БД'
+    help = 'Импорт ингредиентов и тегов в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=Path,
+            default=settings.BASE_DIR / 'data',
+            help='Каталог с ingredients.json и tags.json',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей в одном запросе',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать изменения, ничего не записывая',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.WARNING('Начало импорта'))
-        with open(
-            'data/ingredients.json',
-            encoding='utf-8',
-        ) as file_data_ingredients:
-            ingredient_data = json.loads(file_data_ingredients.read())
-            for ingredients in ingredient_data:
-                Ingredient.objects.get_or_create(**ingredients)
-
-        with open(
-            'data/tags.json',
-            encoding='utf-8',
-        ) as file_data_tags:
-            tags_data = json.loads(file_data_tags.read())
-            for tags in tags_data:
-                Tag.objects.get_or_create(**tags)
-
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        for name, importer, version in (
+            ('ingredients', self.import_ingredients, INGREDIENTS_VERSION),
+            ('tags', self.import_tags, TAGS_VERSION),
+        ):
+            with open(
+                options['path'] / f'{name}.json',
+                encoding='utf-8',
+            ) as file:
+                summary = importer(iter_rows(file))
+            if summary['inserted'] and not self.dry_run:
+                bump_version(version)
+            self.stdout.write(
+                f'{name}: добавлено {summary["inserted"]}, '
+                f'без изменений {summary["unchanged"]}, '
+                f'конфликтов {summary["conflicting"]}'
+            )
+        if not self.dry_run:
+            INGREDIENTS_PAYLOAD.build()
+            TAGS_PAYLOAD.build()
         self.stdout.write(self.style.SUCCESS('Конец импорта'))
+
+    def import_ingredients(self, rows):
+        """Добавляет недостающие ингредиенты пачками.
+
+        Ключ — пара (название, единица измерения) из ограничения
+        unique_ingredient; совпавшие строки остаются без изменений.
+        """
+        summary = Counter(inserted=0, unchanged=0, conflicting=0)
+        for batch in batched(rows, self.batch_size):
+            keys = {}
+            for row in batch:
+                name = row.get('name')
+                unit = row.get('measurement_unit')
+                if not (is_text(name, const.MAX_LENGTH_INGREDIENT_NAME)
+                        and is_text(unit, const.MAX_LENGTH_INGREDIENT_M_UNIT)):
+                    summary['conflicting'] += 1
+                elif (name, unit) in keys:
+                    summary['unchanged'] += 1
+                else:
+                    keys[name, unit] = Ingredient(
+                        name=name, measurement_unit=unit
+                    )
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('name', 'measurement_unit'))
+            new = [
+                ingredient for key, ingredient in keys.items()
+                if key not in existing
+            ]
+            summary['unchanged'] += len(keys) - len(new)
+            summary['inserted'] += len(new)
+            if new and not self.dry_run:
+                Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+        return summary
+
+    def import_tags(self, rows):
+        """Добавляет недостающие теги, сверяя существующие по slug.
+
+        Тег с тем же slug, но другими названием или цветом, тег с уже
+        занятым цветом и тег с полями, нарушающими длины и форматы модели,
+        считаются конфликтом и не перезаписываются.
+        """
+        summary = Counter(inserted=0, unchanged=0, conflicting=0)
+        by_slug = {tag.slug: tag for tag in Tag.objects.all()}
+        colors = {tag.color.lower() for tag in by_slug.values()}
+        for batch in batched(rows, self.batch_size):
+            new = []
+            for row in batch:
+                tag = Tag(
+                    name=row.get('name'),
+                    color=row.get('color'),
+                    slug=row.get('slug'),
+                )
+                if not is_valid_tag(tag):
+                    summary['conflicting'] += 1
+                    continue
+                current = by_slug.get(tag.slug)
+                if current is not None:
+                    same = (current.name, current.color.lower()) == (
+                        tag.name, tag.color.lower()
+                    )
+                    summary['unchanged' if same else 'conflicting'] += 1
+                elif tag.color.lower() in colors:
+                    summary['conflicting'] += 1
+                else:
+                    by_slug[tag.slug] = tag
+                    colors.add(tag.color.lower())
+                    new.append(tag)
+            summary['inserted'] += len(new)
+            if new and not self.dry_run:
+                Tag.objects.bulk_create(new, ignore_conflicts=True)
+        return summary
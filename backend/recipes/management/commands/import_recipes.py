@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import time
+from collections import Counter
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+import foodgram.constants as const
+from foodgram.counters import change_counter
+from foodgram.versioning import (AUTHORS_VERSION, RECIPES_VERSION,
+                                 USERS_VERSION, bump_version)
+from recipes.feed import schedule_fan_out
+from recipes.models import (Ingredient, Recipe, RecipeIngredients, RecipeTags,
+                            Tag)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Импорт рецептов из файла NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON, рецепт на строку')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество рецептов в одной транзакции',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл позиции продолжения, по умолчанию <path>.checkpoint',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать импорт с начала файла, игнорируя позицию',
+        )
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог с файлами фото; без него пути берутся из хранилища',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.isfile(options['path']):
+            raise CommandError(f'Файл {options["path"]} не найден')
+        self.images_dir = options['images_dir']
+        checkpoint = options['checkpoint'] or f'{options["path"]}.checkpoint'
+        state = {'offset': 0, 'line': 0, 'imported': 0, 'skipped': 0}
+        if not options['restart'] and os.path.exists(checkpoint):
+            with open(checkpoint, encoding='utf-8') as file:
+                state = json.load(file)
+            self.stdout.write(self.style.WARNING(
+                f'Продолжение со строки {state["line"] + 1}'
+            ))
+        self.load_lookups()
+        started = time.monotonic()
+        imported = skipped = 0
+        with open(options['path'], 'rb') as file:
+            file.seek(state['offset'])
+            batch = []
+            for line in iter(file.readline, b''):
+                state['line'] += 1
+                recipe = self.parse(line, state['line'])
+                if recipe is None:
+                    skipped += 1
+                    state['skipped'] += 1
+                else:
+                    batch.append(recipe)
+                if len(batch) >= options['batch_size']:
+                    imported += self.write_batch(batch, state)
+                    batch = []
+                    self.save_checkpoint(checkpoint, state, file.tell())
+            imported += self.write_batch(batch, state)
+            self.save_checkpoint(checkpoint, state, file.tell())
+        bump_version(RECIPES_VERSION)
+        bump_version(USERS_VERSION)
+        bump_version(AUTHORS_VERSION)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано рецептов: {imported}, пропущено: {skipped}, '
+            f'время: {elapsed:.1f} с, '
+            f'скорость: {imported / max(elapsed, 1e-6):.0f} рецептов/с'
+        ))
+        if imported:
+            self.stdout.write(self.style.WARNING(
+                'Для построения вариантов фото выполните process_images'
+            ))
+
+    def load_lookups(self):
+        self.tags = {}
+        for pk, slug in Tag.objects.values_list('pk', 'slug'):
+            self.tags[slug] = self.tags[pk] = pk
+        self.ingredients = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit'
+            ).iterator()
+        }
+        self.ingredient_ids = set(self.ingredients.values())
+        self.authors = {}
+        for pk, email, username in User.objects.values_list(
+            'pk', 'email', 'username'
+        ).iterator():
+            self.authors[email] = self.authors[username] = pk
+
+    def warn(self, line_number, message):
+        self.stdout.write(self.style.WARNING(
+            f'Строка {line_number}: {message}'
+        ))
+
+    def resolve_ingredient(self, item):
+        if 'id' in item:
+            pk = item['id']
+            return pk if pk in self.ingredient_ids else None
+        return self.ingredients.get((item['name'], item['measurement_unit']))
+
+    def parse(self, line, line_number):
+        """Рецепт строки с разрешёнными ссылками или None при ошибке."""
+        if not line.strip():
+            return None
+        try:
+            data = json.loads(line)
+            author_id = self.authors.get(data['author'])
+            tag_ids = {self.tags.get(tag) for tag in data['tags']}
+            ingredients = {}
+            for item in data['ingredients']:
+                pk = self.resolve_ingredient(item)
+                if pk is None:
+                    self.warn(line_number, f'ингредиент {item} не найден')
+                    return None
+                ingredients[pk] = ingredients.get(pk, 0) + item['amount']
+            recipe = Recipe(
+                name=data['name'][:const.MAX_LENGTH_RECIPE_NAME],
+                text=data['text'],
+                cooking_time=int(data['cooking_time']),
+                image=data['image'],
+                author_id=author_id,
+            )
+        except (KeyError, TypeError, ValueError) as error:
+            self.warn(line_number, f'некорректная запись ({error!r})')
+            return None
+        if author_id is None:
+            self.warn(line_number, f'автор {data["author"]} не найден')
+            return None
+        if None in tag_ids or not tag_ids:
+            self.warn(line_number, f'теги {data["tags"]} не найдены')
+            return None
+        if (recipe.cooking_time < const.MIN_COOKING_TIME
+                or not ingredients
+                or min(ingredients.values())
+                < const.MIN_VALUE_INGREDIENT_AMOUNT):
+            self.warn(line_number, 'некорректное время или состав')
+            return None
+        return recipe, tag_ids, ingredients
+
+    def store_image(self, path):
+        if self.images_dir is None:
+            return path
+        with open(os.path.join(self.images_dir, path), 'rb') as file:
+            return default_storage.save(
+                f'recipes/images/{os.path.basename(path)}', File(file)
+            )
+
+    def create_recipes(self, recipes):
+        for recipe in recipes:
+            recipe.image = self.store_image(recipe.image.name)
+        if connection.features.can_return_rows_from_bulk_insert:
+            return Recipe.objects.bulk_create(recipes)
+        for recipe in recipes:
+            recipe.save()
+        return recipes
+
+    def copy_rows(self, model, fields, rows):
+        """Вставляет строки COPY на PostgreSQL и bulk_create иначе."""
+        if connection.vendor != 'postgresql':
+            model.objects.bulk_create(
+                model(**dict(zip(fields, row))) for row in rows
+            )
+            return
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(map(str, row)) + '\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_from(
+                buffer,
+                model._meta.db_table,
+                columns=[model._meta.get_field(field).column
+                         for field in fields],
+            )
+
+    @transaction.atomic
+    def write_batch(self, batch, state):
+        if not batch:
+            return 0
+        recipes = self.create_recipes([recipe for recipe, _, _ in batch])
+        self.copy_rows(
+            RecipeTags,
+            ('recipe_id', 'tag_id'),
+            [
+                (recipe.pk, tag_id)
+                for recipe, (_, tag_ids, _) in zip(recipes, batch)
+                for tag_id in tag_ids
+            ],
+        )
+        self.copy_rows(
+            RecipeIngredients,
+            ('recipe_id', 'ingredient_id', 'amount'),
+            [
+                (recipe.pk, ingredient_id, amount)
+                for recipe, (_, _, ingredients) in zip(recipes, batch)
+                for ingredient_id, amount in ingredients.items()
+            ],
+        )
+        if connection.features.can_return_rows_from_bulk_insert:
+            authors = Counter(recipe.author_id for recipe in recipes)
+            for author_id, count in authors.items():
+                change_counter(User, author_id, 'recipes_count', count)
+            schedule_fan_out(recipe.pk for recipe in recipes)
+        state['imported'] += len(recipes)
+        return len(recipes)
+
+    def save_checkpoint(self, path, state, offset):
+        state['offset'] = offset
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(f'{path}.tmp', path)
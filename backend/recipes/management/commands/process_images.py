@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import needs_processing, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построение вариантов фото для существующих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересобрать варианты, даже если они уже построены',
+        )
+        parser.add_argument(
+            '--recipe',
+            type=int,
+            nargs='+',
+            dest='recipe_ids',
+            help='Ограничить обработку указанными рецептами',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only(
+            'image', 'image_variants'
+        ).order_by('pk')
+        if options['recipe_ids'] is not None:
+            recipes = recipes.filter(pk__in=options['recipe_ids'])
+        processed = failed = 0
+        for recipe in recipes.iterator():
+            if options['force']:
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    image_variants={
+                        key: value
+                        for key, value in recipe.image_variants.items()
+                        if key != 'source'
+                    }
+                )
+            elif not needs_processing(recipe):
+                continue
+            try:
+                processed += process_recipe_image(recipe.pk)
+            except Exception as error:
+                failed += 1
+                self.stdout.write(self.style.WARNING(
+                    f'Рецепт {recipe.pk}: {error}'
+                ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано фото: {processed}, с ошибками: {failed}'
+        ))
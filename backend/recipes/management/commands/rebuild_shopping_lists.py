@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+from recipes.shopping_list import CHUNK_SIZE, calculate_shopping_lists
+
+
+class Command(BaseCommand):
+    help = 'Пересборка и проверка сохранённых списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые списки с корзинами',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            nargs='+',
+            dest='user_ids',
+            help='Ограничить обработку указанными пользователями',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        expected = calculate_shopping_lists(user_ids)
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        if options['verify']:
+            self.verify(items, expected)
+            return
+        with transaction.atomic():
+            items.delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                        recipes_count=recipes_count,
+                    )
+                    for (user_id, ingredient_id), (amount, recipes_count)
+                    in expected.items()
+                ),
+                batch_size=CHUNK_SIZE,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, позиций: {len(expected)}'
+        ))
+
+    def verify(self, items, expected):
+        stored = {
+            (user_id, ingredient_id): (amount, recipes_count)
+            for user_id, ingredient_id, amount, recipes_count
+            in items.values_list(
+                'user_id', 'ingredient_id', 'amount', 'recipes_count'
+            ).iterator(chunk_size=CHUNK_SIZE)
+        }
+        missing = expected.keys() - stored.keys()
+        extra = stored.keys() - expected.keys()
+        changed = [
+            key for key in expected.keys() & stored.keys()
+            if expected[key] != stored[key]
+        ]
+        if not (missing or extra or changed):
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+            return
+        self.stdout.write(self.style.WARNING(
+            f'Отсутствует позиций: {len(missing)}, лишних: {len(extra)}, '
+            f'с неверным количеством: {len(changed)}'
+        ))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodgram.versioning import FEED_VERSION, bump_version
+from recipes.feed import add_to_timelines, latest_recipes
+from recipes.models import TimelineEntry
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка лент подписок: каждому подписчику записываются '
+        'последние рецепты авторов, кроме знаменитостей'
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            author_ids = Follow.objects.order_by('author_id').values_list(
+                'author_id', flat=True
+            ).distinct()
+            for author_id in author_ids.iterator():
+                recipes = list(latest_recipes(author_id))
+                if not recipes:
+                    continue
+                add_to_timelines(
+                    Follow.objects.filter(author_id=author_id).values_list(
+                        'user_id', flat=True
+                    ),
+                    recipes,
+                )
+            bump_version(FEED_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, записей: {TimelineEntry.objects.count()} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,21 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from foodgram.counters import get_counters, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверка и исправление счётчиков рецептов и пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения',
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(get_counters(apps), options['dry_run'])
+        for counter, rows in drift.items():
+            style = self.style.WARNING if rows else self.style.SUCCESS
+            self.stdout.write(style(f'{counter}: расхождений {rows}'))
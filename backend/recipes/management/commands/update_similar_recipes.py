@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+import foodgram.constants as const
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Расчёт похожих рецептов по ингредиентам и тегам; по умолчанию '
+        'только для рецептов, состав которых изменился'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать списки всех рецептов',
+        )
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=const.SIMILAR_RECIPES_COUNT,
+            help='Размер списка похожих; при изменении нужен --full',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        changed, updated = update_similar_recipes(
+            options['full'], options['count']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменённых рецептов: {changed}, пересчитано списков: '
+            f'{updated} за {time.monotonic() - started:.1f} с'
+        ))
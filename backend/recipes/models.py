@@ -1,13 +1,17 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 import foodgram.constants as const
 import foodgram.validators as validate
+from foodgram.counters import CountersModelMixin
 from users.models import User
 
 
-class Recipe(models.Model):
+class Recipe(CountersModelMixin, models.Model):
     """Модель рецептов."""
 
+    counter_fields = ('favorites_count', 'in_carts_count')
+
     name = models.CharField(
         max_length=const.MAX_LENGTH_RECIPE_NAME,
         verbose_name='Название',
@@ -26,6 +30,21 @@ class Recipe(models.Model):
         verbose_name='Фото блюда',
         help_text='Выберите изображение',
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Ширина фото',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Высота фото',
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Варианты фото',
+    )
     text = models.TextField(
         verbose_name='Описание',
         help_text='Укажите способ приготовления',
@@ -55,11 +74,43 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         help_text='Дата публикации',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+    similarity_key = models.CharField(
+        max_length=32,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Ключ состава для похожих рецептов',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -252,3 +303,133 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return (f'Рецепт {self.recipe} в списке покупок у пользователя '
                 f'{self.user.first_name} {self.user.last_name}')
+
+
+class ShoppingListItem(models.Model):
+    """Модель суммарного списка покупок пользователя.
+
+    Хранит количество ингредиента по всем рецептам корзины и число этих
+    рецептов; обновляется при изменении корзины и состава рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество',
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self):
+        return (f'{self.ingredient} в количестве {self.amount} в списке '
+                f'покупок пользователя {self.user}')
+
+
+class TimelineEntry(models.Model):
+    """Модель записи ленты подписок.
+
+    Рецепт попадает в ленты подписчиков автора после публикации; дата
+    публикации и автор продублированы, чтобы страница ленты читалась
+    одним проходом по индексу, а отписка удаляла записи без соединений.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте пользователя {self.user}'
+
+
+class RecipeNeighbour(models.Model):
+    """Модель похожего рецепта.
+
+    Заполняется командой update_similar_recipes: для каждого рецепта
+    хранятся наиболее похожие по ингредиентам и тегам с оценкой сходства.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт',
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbour_of',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbour'],
+                name='unique_recipe_neighbour',
+            )
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.neighbour} похож на {self.recipe}'
@@ -0,0 +1,96 @@
+import gzip
+import re
+import threading
+
+import brotli
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.versioning import INGREDIENTS_VERSION, TAGS_VERSION, get_version
+from .models import Ingredient, Tag
+from .serializers import IngredientSerializer, TagSerializer
+
+PAYLOAD_KEY = 'foodgram:payload:{}:{}'
+ENCODINGS = (
+    ('br', re.compile(r'\bbr\b')),
+    ('gzip', re.compile(r'\bgzip\b')),
+)
+
+
+class ReferencePayload:
+    """Готовый ответ со справочником во всех поддерживаемых кодировках.
+
+    JSON и его сжатые варианты собираются один раз на версию данных,
+    кладутся в общий кеш ответов и держатся в памяти процесса, так что
+    запрос без фильтров обходится поиском по словарю.
+    """
+
+    def __init__(self, version_name, queryset, serializer_class):
+        self.version_name = version_name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self.lock = threading.Lock()
+        self.local = {}
+
+    def get_cache_key(self, version):
+        return PAYLOAD_KEY.format(self.version_name, version)
+
+    def build(self, version=None):
+        """Собирает варианты ответа для версии version или текущей."""
+        if version is None:
+            version = get_version(self.version_name)
+        content = JSONRenderer().render(
+            self.serializer_class(self.queryset.all(), many=True).data
+        )
+        variants = {
+            None: content,
+            'gzip': gzip.compress(content),
+            'br': brotli.compress(content),
+        }
+        caches[settings.RESPONSE_CACHE_ALIAS].set(
+            self.get_cache_key(version), variants, timeout=None
+        )
+        self.local = {'version': version, 'variants': variants}
+        return variants
+
+    def get_variants(self):
+        version = get_version(self.version_name)
+        if self.local.get('version') == version:
+            return self.local['variants']
+        with self.lock:
+            if self.local.get('version') == version:
+                return self.local['variants']
+            variants = caches[settings.RESPONSE_CACHE_ALIAS].get(
+                self.get_cache_key(version)
+            )
+            if variants is None:
+                return self.build(version)
+            self.local = {'version': version, 'variants': variants}
+            return variants
+
+    def response(self, request):
+        """Ответ в лучшей кодировке из Accept-Encoding запроса."""
+        variants = self.get_variants()
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        encoding = next(
+            (name for name, pattern in ENCODINGS
+             if pattern.search(accept_encoding)),
+            None,
+        )
+        response = HttpResponse(
+            variants[encoding], content_type='application/json'
+        )
+        response['Content-Length'] = len(variants[encoding])
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+TAGS_PAYLOAD = ReferencePayload(TAGS_VERSION, Tag.objects.all(), TagSerializer)
+INGREDIENTS_PAYLOAD = ReferencePayload(
+    INGREDIENTS_VERSION, Ingredient.objects.all(), IngredientSerializer
+)
@@ -1,7 +1,10 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers, status
 
 import foodgram.constants as const
+from foodgram.fields import ImageField
 from users.models import User
 from users.serializers import UserSerializer
 from .models import (
@@ -9,15 +12,48 @@ from .models import (
     Ingredient,
     Recipe,
     RecipeIngredients,
+    RecipeTags,
     ShoppingCart,
     Tag,
 )
+from .shopping_list import replace_recipe_ingredients
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Карта вариантов фото: размер -> габариты и ссылки по форматам."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        variants = {}
+        for name, variant in value.items():
+            if name == 'source':
+                continue
+            variants[name] = {
+                'width': variant['width'],
+                'height': variant['height'],
+            }
+            for image_format, path in variant['files'].items():
+                url = default_storage.url(path)
+                variants[name][image_format] = (
+                    request.build_absolute_uri(url) if request else url
+                )
+        return variants
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id',
+            'name',
+            'image',
+            'image_width',
+            'image_height',
+            'image_variants',
+            'cooking_time',
+        )
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -39,9 +75,7 @@ class RecipeIngredientsSerializer(serializers.ModelSerializer):
 
 
 class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredients
@@ -78,13 +112,10 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class CreateUpdateRecipeSerializer(RecipeSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     author = UserSerializer(read_only=True)
     ingredients = AddIngredientToRecipeSerializer(many=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = ImageField(max_length=None, use_url=True)
 
     def validate_cooking_time(self, value):
         if value < const.MIN_COOKING_TIME:
@@ -95,20 +126,35 @@ class CreateUpdateRecipeSerializer(RecipeSerializer):
             )
         return value
 
+    @staticmethod
+    def check_ids(model, ids):
+        """Проверяет идентификаторы одним запросом IN.
+
+        Все отсутствующие в базе и повторяющиеся идентификаторы попадают
+        в одну ошибку.
+        """
+        unique_ids = set()
+        duplicates = set()
+        for pk in ids:
+            (duplicates if pk in unique_ids else unique_ids).add(pk)
+        missing = unique_ids - set(model.objects.filter(
+            pk__in=unique_ids
+        ).values_list('pk', flat=True))
+        errors = {}
+        if missing:
+            errors['missing'] = sorted(missing)
+        if duplicates:
+            errors['duplicates'] = sorted(duplicates)
+        if errors:
+            raise serializers.ValidationError(errors)
+
     def validate_tags(self, value):
         if not value:
             raise serializers.ValidationError(
                 'Необходимо выбрать теги',
                 status.HTTP_400_BAD_REQUEST,
             )
-        tags_list = []
-        for tag in value:
-            if tag.pk in tags_list:
-                raise serializers.ValidationError(
-                    f'Тег {tag} повторяется',
-                    status.HTTP_400_BAD_REQUEST,
-                )
-            tags_list.append(tag.pk)
+        self.check_ids(Tag, value)
         return value
 
     def validate_ingredients(self, value):
@@ -117,52 +163,124 @@ class CreateUpdateRecipeSerializer(RecipeSerializer):
                 'Необходимо выбрать ингредиенты',
                 status.HTTP_400_BAD_REQUEST,
             )
-        ingredients_list = []
-        for ingredient in value:
-            ingredient_id = ingredient['id'].id
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError(
-                    f'Ингредиент "{ingredient_id}" повторяется',
-                    status.HTTP_400_BAD_REQUEST,
-                )
-            ingredients_list.append(ingredient_id)
+        self.check_ids(Ingredient, [item['id'] for item in value])
         return value
 
-    def make_ingredients(self, recipe, ingredients):
-        ingredient_list = []
-        for ingredient in ingredients:
-            ingredient_list.append(
-                RecipeIngredients(
-                    recipe=recipe,
-                    ingredient=ingredient['id'],
-                    amount=ingredient['amount'],
-                )
+    def create_links(self, recipe, tag_ids, ingredients):
+        RecipeTags.objects.bulk_create(
+            RecipeTags(recipe=recipe, tag_id=tag_id) for tag_id in tag_ids
+        )
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
             )
-        RecipeIngredients.objects.bulk_create(ingredient_list)
+            for ingredient_id, amount in ingredients.items()
+        )
+
+    def update_tags(self, recipe, tag_ids):
+        current = set(RecipeTags.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        removed = current - set(tag_ids)
+        if removed:
+            RecipeTags.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        RecipeTags.objects.bulk_create(
+            RecipeTags(recipe=recipe, tag_id=tag_id)
+            for tag_id in tag_ids if tag_id not in current
+        )
 
+    def update_ingredients(self, recipe, ingredients):
+        """Применяет к рецепту разницу между старым и новым составом.
+
+        Возвращает прежний состав парами (id ингредиента, количество)
+        или None, если состав не изменился.
+        """
+        current = {
+            link.ingredient_id: link
+            for link in RecipeIngredients.objects.filter(
+                recipe=recipe
+            ).select_for_update()
+        }
+        old_ingredients = [
+            (ingredient_id, link.amount)
+            for ingredient_id, link in current.items()
+        ]
+        removed = [
+            link.pk for ingredient_id, link in current.items()
+            if ingredient_id not in ingredients
+        ]
+        changed = []
+        for ingredient_id, amount in ingredients.items():
+            link = current.get(ingredient_id)
+            if link is not None and link.amount != amount:
+                link.amount = amount
+                changed.append(link)
+        created = [
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for ingredient_id, amount in ingredients.items()
+            if ingredient_id not in current
+        ]
+        if not (removed or changed or created):
+            return None
+        if removed:
+            RecipeIngredients.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        if created:
+            RecipeIngredients.objects.bulk_create(created)
+        return old_ingredients
+
+    @staticmethod
+    def pop_links(validated_data):
+        tag_ids = validated_data.pop('tags')
+        ingredients = {
+            item['id']: item['amount']
+            for item in validated_data.pop('ingredients')
+        }
+        return tag_ids, ingredients
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
+        tag_ids, ingredients = self.pop_links(validated_data)
         recipe = Recipe.objects.create(
             author=self.context.get('request').user,
             **validated_data,
         )
         recipe.is_favorited = False
         recipe.is_in_shopping_cart = False
-        recipe.tags.set(tags)
-        self.make_ingredients(recipe, ingredients)
+        self.create_links(recipe, tag_ids, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        instance.ingredients.clear()
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
-        self.make_ingredients(instance, ingredients)
+        tag_ids, ingredients = self.pop_links(validated_data)
+        self.update_tags(instance, tag_ids)
+        old_ingredients = self.update_ingredients(instance, ingredients)
+        if old_ingredients is not None:
+            replace_recipe_ingredients(
+                instance, old_ingredients, ingredients.items()
+            )
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance,),
+            'tags',
+            Prefetch(
+                'recipeingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
         return ShowRecipeSerializer(
             instance,
             context={'request': self.context.get('request')},
@@ -176,17 +294,41 @@ class ShowRecipeSerializer(RecipeSerializer):
         source='recipeingredients',
         many=True,
     )
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = ImageField(max_length=None, use_url=True)
     cooking_time = serializers.IntegerField()
     is_favorited = serializers.BooleanField()
     is_in_shopping_cart = serializers.BooleanField()
+    image_variants = ImageVariantsField()
 
     class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + (
+            'image_width',
+            'image_height',
+            'image_variants',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
+            'in_carts_count',
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = ImageField(max_length=None, use_url=True)
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def update(self, instance, validated_data):
+        instance.image = validated_data['image']
+        instance.save(update_fields=('image',))
+        return instance
+
 
 class UsingRecipesSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(
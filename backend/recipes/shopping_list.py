@@ -0,0 +1,234 @@
+import csv
+import json
+from itertools import groupby
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+from .models import RecipeIngredients, ShoppingCart, ShoppingListItem
+
+CHUNK_SIZE = 2000
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def get_recipe_ingredients(recipe_id):
+    return list(RecipeIngredients.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+def update_shopping_lists(user_ids, ingredients, sign):
+    """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта.
+
+    ingredients — пары (id ингредиента, количество). Позиции, в которых
+    не осталось ни одного рецепта, удаляются.
+    """
+    user_ids = list(user_ids)
+    amounts = {}
+    for ingredient_id, amount in ingredients:
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) + (amount or 0)
+    if not user_ids or not amounts:
+        return
+    with transaction.atomic():
+        if sign > 0:
+            ShoppingListItem.objects.bulk_create(
+                [
+                    ShoppingListItem(user_id=user_id, ingredient_id=pk)
+                    for user_id in user_ids
+                    for pk in amounts
+                ],
+                ignore_conflicts=True,
+            )
+        amount_change = Case(
+            *(When(ingredient_id=pk, then=Value(amount))
+              for pk, amount in amounts.items()),
+            output_field=IntegerField(),
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in=amounts,
+        )
+        if sign > 0:
+            items.update(
+                amount=F('amount') + amount_change,
+                recipes_count=F('recipes_count') + 1,
+            )
+        else:
+            items.update(
+                amount=F('amount') - amount_change,
+                recipes_count=F('recipes_count') - 1,
+            )
+            items.filter(recipes_count=0).delete()
+
+
+def replace_recipe_ingredients(recipe, old_ingredients, new_ingredients):
+    """Пересчитывает списки покупок, в корзинах которых лежит рецепт."""
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True))
+    with transaction.atomic():
+        update_shopping_lists(user_ids, old_ingredients, -1)
+        update_shopping_lists(user_ids, new_ingredients, 1)
+
+
+def calculate_shopping_lists(user_ids=None):
+    """Содержимое списков покупок, рассчитанное заново по корзинам.
+
+    Возвращает словарь {(id пользователя, id ингредиента):
+    (количество, число рецептов)}.
+    """
+    ingredients = RecipeIngredients.objects.filter(
+        recipe__shoppingcart__isnull=False
+    )
+    if user_ids is not None:
+        ingredients = ingredients.filter(
+            recipe__shoppingcart__user_id__in=user_ids
+        )
+    ingredients = ingredients.values(
+        'recipe__shoppingcart__user_id', 'ingredient_id'
+    ).annotate(
+        total=Sum('amount'),
+        recipes_count=Count('recipe_id'),
+    ).order_by()
+    return {
+        (row['recipe__shoppingcart__user_id'], row['ingredient_id']):
+        (row['total'] or 0, row['recipes_count'])
+        for row in ingredients.iterator(chunk_size=CHUNK_SIZE)
+    }
+
+
+def get_shopping_list(user, by_recipe=False):
+    """Строки списка покупок, считываемые с сервера порциями.
+
+    Суммарный список читается из ShoppingListItem, с by_recipe строки
+    выдаются отдельно для каждого рецепта корзины.
+    """
+    if by_recipe:
+        ingredients = RecipeIngredients.objects.filter(
+            recipe__shoppingcart__user=user
+        ).order_by(
+            'recipe__name', 'recipe_id', 'ingredient__name'
+        ).values(
+            'recipe_id',
+            'recipe__name',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        )
+    else:
+        ingredients = ShoppingListItem.objects.filter(
+            user=user
+        ).order_by('ingredient__name').values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        )
+    for ingredient in ingredients.iterator(chunk_size=CHUNK_SIZE):
+        row = {
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }
+        if by_recipe:
+            row['recipe_id'] = ingredient['recipe_id']
+            row['recipe'] = ingredient['recipe__name']
+        yield row
+
+
+def format_line(row):
+    return f'{row["name"]} - {row["amount"]} ({row["measurement_unit"]})'
+
+
+def iter_lines(rows, by_recipe):
+    yield 'Список покупок:'
+    if not by_recipe:
+        for row in rows:
+            yield format_line(row)
+        return
+    # Рецепты с одинаковыми названиями выводятся отдельными группами.
+    for (_, recipe), recipe_rows in groupby(
+        rows, key=lambda row: (row['recipe_id'], row['recipe'])
+    ):
+        yield ''
+        yield f'{recipe}:'
+        for row in recipe_rows:
+            yield format_line(row)
+
+
+def write_txt(rows, by_recipe):
+    lines = iter_lines(rows, by_recipe)
+    yield next(lines)
+    for line in lines:
+        yield f'\n{line}'
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def write_csv(rows, by_recipe):
+    fields = ['name', 'measurement_unit', 'amount']
+    if by_recipe:
+        fields.insert(0, 'recipe')
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def write_json(rows, by_recipe):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps(row, ensure_ascii=False)
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
+
+
+def write_pdf(rows, by_recipe):
+    """PDF собирается во временном файле и отдаётся частями.
+
+    Таблица ссылок PDF пишется в конец документа, поэтому файл нельзя
+    отдавать по мере формирования: он сохраняется во временный файл,
+    который при превышении SPOOL_MAX_SIZE переносится на диск.
+    """
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as file:
+        canvas = Canvas(file, pagesize=A4)
+        width, height = A4
+        position = height - PDF_MARGIN
+
+        def draw(text):
+            nonlocal position
+            if position < PDF_MARGIN:
+                canvas.showPage()
+                position = height - PDF_MARGIN
+            canvas.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+            canvas.drawString(PDF_MARGIN, position, text)
+            position -= PDF_FONT_SIZE * 1.5
+
+        for line in iter_lines(rows, by_recipe):
+            draw(line)
+        canvas.save()
+        file.seek(0)
+        yield from iter(lambda: file.read(CHUNK_SIZE * 32), b'')
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', write_txt),
+    'csv': ('text/csv; charset=utf-8', write_csv),
+    'json': ('application/json', write_json),
+    'pdf': ('application/pdf', write_pdf),
+}
@@ -0,0 +1,179 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from foodgram.counters import change_counter
+from foodgram.versioning import (
+    AUTHORS_VERSION,
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    USERS_VERSION,
+    bump_version,
+    recipe_version,
+    user_version,
+)
+from users.models import Follow, User
+from .feed import (
+    backfill_timeline,
+    follower_removed,
+    remove_from_timeline,
+    schedule_fan_out,
+)
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeTags,
+    ShoppingCart,
+    Tag,
+)
+from .images import (
+    needs_processing,
+    schedule_image_processing,
+    schedule_variants_deletion,
+)
+from .shopping_list import get_recipe_ingredients, update_shopping_lists
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_version(INGREDIENTS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(**kwargs):
+    bump_version(TAGS_VERSION)
+
+
+def recipes_changed(*recipe_ids):
+    bump_version(RECIPES_VERSION)
+    for recipe_id in recipe_ids:
+        bump_version(recipe_version(recipe_id))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    recipes_changed(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeTags)
+def recipe_tag_changed(instance, **kwargs):
+    recipes_changed(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=RecipeTags)
+def recipe_tags_set(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    recipe_ids = (pk_set or ()) if reverse else (instance.pk,)
+    recipes_changed(*recipe_ids)
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        return
+    bump_version(USERS_VERSION)
+    if instance.recipes_count:
+        bump_version(RECIPES_VERSION)
+        bump_version(AUTHORS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def user_recipes_changed(instance, **kwargs):
+    # Общую версию списков не меняем: счётчики рецепта в списках
+    # обновляются по времени, иначе каждое нажатие «в избранное»
+    # сбрасывало бы кеши и ETag всех пользователей.
+    bump_version(user_version(instance.user_id))
+    bump_version(recipe_version(instance.recipe_id))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added_to_cart(instance, created, **kwargs):
+    if created:
+        update_shopping_lists(
+            (instance.user_id,),
+            get_recipe_ingredients(instance.recipe_id),
+            1,
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def recipe_removed_from_cart(instance, **kwargs):
+    update_shopping_lists(
+        (instance.user_id,),
+        get_recipe_ingredients(instance.recipe_id),
+        -1,
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, **kwargs):
+    if needs_processing(instance):
+        schedule_image_processing(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(instance, **kwargs):
+    schedule_variants_deletion(instance.image_variants)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        bump_version(USERS_VERSION)
+        bump_version(AUTHORS_VERSION)
+        schedule_fan_out((instance.pk,))
+
+
+@receiver(post_save, sender=Follow)
+def author_followed(instance, created, **kwargs):
+    if created:
+        backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def author_unfollowed(instance, **kwargs):
+    remove_from_timeline(instance.user_id, instance.author_id)
+    follower_removed(instance.author_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_neighbour_deleted(instance, **kwargs):
+    """Списки похожих, где был удаляемый рецепт, пересчитаются заново."""
+    Recipe.objects.filter(neighbours__neighbour=instance).update(
+        similarity_key=''
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    bump_version(USERS_VERSION)
+    bump_version(AUTHORS_VERSION)
+
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, RECIPE_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_removed(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, RECIPE_COUNTERS[sender], -1)
@@ -0,0 +1,211 @@
+from hashlib import md5
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+import foodgram.constants as const
+from foodgram.utils import batched
+from foodgram.versioning import SIMILAR_VERSION, bump_version
+from .models import Recipe, RecipeIngredients, RecipeNeighbour, RecipeTags
+
+CHUNK_SIZE = 10000
+MIN_SCORE = np.finfo(np.float32).tiny
+
+
+def load_pairs(queryset, field, recipe_ids):
+    """Пары (id рецепта, id признака) массивом numpy.
+
+    Пары рецептов, созданных после чтения recipe_ids, отбрасываются.
+    """
+    pairs = np.fromiter(
+        chain.from_iterable(
+            queryset.values_list('recipe_id', field).iterator(
+                chunk_size=CHUNK_SIZE
+            )
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[np.isin(pairs[:, 0], recipe_ids)]
+
+
+def composition_keys(recipe_ids, ingredients, tags):
+    """Ключи состава рецептов: md5 отсортированных ингредиентов и тегов."""
+    recipes = np.concatenate((ingredients[:, 0], tags[:, 0]))
+    features = np.concatenate((ingredients[:, 1] * 2, tags[:, 1] * 2 + 1))
+    order = np.lexsort((features, recipes))
+    recipes, features = recipes[order], features[order]
+    starts = np.searchsorted(recipes, recipe_ids, side='left')
+    ends = np.searchsorted(recipes, recipe_ids, side='right')
+    return [
+        md5(features[start:end].tobytes()).hexdigest()
+        for start, end in zip(starts, ends)
+    ]
+
+
+def build_matrix(recipe_ids, ingredients, tags):
+    """Матрица рецепт × признак с весами IDF и нормированными строками.
+
+    Признаки — ингредиенты и теги, теги учитываются с весом
+    SIMILARITY_TAG_WEIGHT. Произведение строк такой матрицы равно
+    косинусному сходству рецептов.
+    """
+    ingredient_ids, ingredient_columns = np.unique(
+        ingredients[:, 1], return_inverse=True
+    )
+    tag_ids, tag_columns = np.unique(tags[:, 1], return_inverse=True)
+    columns = np.concatenate((
+        ingredient_columns.ravel(),
+        tag_columns.ravel() + len(ingredient_ids),
+    ))
+    rows = np.searchsorted(
+        recipe_ids, np.concatenate((ingredients[:, 0], tags[:, 0]))
+    )
+    weights = np.concatenate((
+        np.ones(len(ingredients)),
+        np.full(len(tags), const.SIMILARITY_TAG_WEIGHT),
+    ))
+    shape = (len(recipe_ids), len(ingredient_ids) + len(tag_ids))
+    frequency = np.bincount(columns, minlength=shape[1])
+    idf = np.log((1 + shape[0]) / (1 + frequency)) + 1
+    matrix = sparse.csr_matrix(
+        (weights * idf[columns], (rows, columns)),
+        shape=shape,
+        dtype=np.float32,
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def similarity_blocks(matrix, rows):
+    """Плотные блоки сходства строк rows со всеми рецептами.
+
+    Размер блока ограничен SIMILARITY_BLOCK_CELLS ячейками.
+    """
+    transposed = matrix.T.tocsr()
+    size = max(1, const.SIMILARITY_BLOCK_CELLS // max(matrix.shape[0], 1))
+    for start in range(0, len(rows), size):
+        block = rows[start:start + size]
+        scores = (matrix[block] @ transposed).toarray()
+        scores[np.arange(len(block)), block] = 0
+        yield block, scores
+
+
+def top_neighbours(scores, count):
+    """Индексы и оценки count наиболее похожих для каждой строки блока.
+
+    При равных оценках выше стоит рецепт с меньшим id, чтобы результат
+    не зависел от разбиения строк на блоки.
+    """
+    count = min(count, scores.shape[1] - 1)
+    if count <= 0:
+        return
+    lowest = -np.partition(-scores, count - 1, axis=1)[:, count - 1]
+    for row, bound in zip(scores, lowest):
+        candidates = np.flatnonzero(row >= max(bound, MIN_SCORE))
+        order = np.lexsort((candidates, -row[candidates]))[:count]
+        yield candidates[order], row[candidates[order]]
+
+
+def affected_rows(matrix, recipe_ids, changed, count):
+    """Строки, списки похожих которых могут измениться.
+
+    Это сами изменённые рецепты, рецепты, в чьих списках они есть, и
+    рецепты, для которых изменённый рецепт похожее последнего в списке
+    (или любой похожий, если список короче count).
+    """
+    affected = np.zeros(len(recipe_ids), dtype=bool)
+    affected[changed] = True
+    thresholds = np.zeros(len(recipe_ids), dtype=np.float32)
+    for recipe_id, total, lowest in RecipeNeighbour.objects.values(
+        'recipe_id'
+    ).annotate(
+        total=Count('pk'), lowest=Min('score')
+    ).values_list('recipe_id', 'total', 'lowest').iterator(
+        chunk_size=CHUNK_SIZE
+    ):
+        if total >= count:
+            index = np.searchsorted(recipe_ids, recipe_id)
+            if index < len(recipe_ids) and recipe_ids[index] == recipe_id:
+                thresholds[index] = lowest
+    for batch in batched(recipe_ids[changed].tolist(), CHUNK_SIZE):
+        holders = RecipeNeighbour.objects.filter(
+            neighbour_id__in=batch
+        ).values_list('recipe_id', flat=True)
+        affected |= np.isin(recipe_ids, list(holders))
+    for _, scores in similarity_blocks(matrix, changed):
+        affected |= (scores > thresholds).any(axis=0)
+    return np.flatnonzero(affected)
+
+
+def save_neighbours(recipe_ids, block, scores, count):
+    block_ids = recipe_ids[block].tolist()
+    with transaction.atomic():
+        RecipeNeighbour.objects.filter(recipe_id__in=block_ids).delete()
+        RecipeNeighbour.objects.bulk_create(
+            (
+                RecipeNeighbour(
+                    recipe_id=recipe_id,
+                    neighbour_id=neighbour_id,
+                    score=score,
+                )
+                for recipe_id, (neighbours, row_scores) in zip(
+                    block_ids, top_neighbours(scores, count)
+                )
+                for neighbour_id, score in zip(
+                    recipe_ids[neighbours].tolist(), row_scores.tolist()
+                )
+            ),
+            batch_size=CHUNK_SIZE,
+        )
+
+
+def update_similar_recipes(full=False, count=const.SIMILAR_RECIPES_COUNT):
+    """Пересчитывает списки похожих рецептов.
+
+    Без full пересчитываются только рецепты, состав которых изменился
+    с прошлого запуска, и рецепты, чьи списки это затрагивает. Веса IDF
+    при этом берутся по текущим данным, поэтому время от времени
+    стоит выполнять полный пересчёт. Возвращает число изменённых
+    рецептов и пересчитанных списков.
+    """
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by('pk').values_list('pk', flat=True).iterator(
+            chunk_size=CHUNK_SIZE
+        ),
+        dtype=np.int64,
+    )
+    ingredients = load_pairs(
+        RecipeIngredients.objects.all(), 'ingredient_id', recipe_ids
+    )
+    tags = load_pairs(RecipeTags.objects.all(), 'tag_id', recipe_ids)
+    keys = composition_keys(recipe_ids, ingredients, tags)
+    stored = dict(Recipe.objects.values_list('pk', 'similarity_key').iterator(
+        chunk_size=CHUNK_SIZE
+    ))
+    changed = np.array([
+        index for index, recipe_id in enumerate(recipe_ids.tolist())
+        if full or stored.get(recipe_id) != keys[index]
+    ], dtype=np.int64)
+    if not len(changed):
+        return 0, 0
+    matrix = build_matrix(recipe_ids, ingredients, tags)
+    if full:
+        rows = np.arange(len(recipe_ids))
+    else:
+        rows = affected_rows(matrix, recipe_ids, changed, count)
+    for block, scores in similarity_blocks(matrix, rows):
+        save_neighbours(recipe_ids, block, scores, count)
+    Recipe.objects.bulk_update(
+        [
+            Recipe(pk=int(recipe_ids[index]), similarity_key=keys[index])
+            for index in changed.tolist()
+        ],
+        ('similarity_key',),
+        batch_size=CHUNK_SIZE,
+    )
+    bump_version(SIMILAR_VERSION)
+    return len(changed), len(rows)
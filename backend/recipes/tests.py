@@ -0,0 +1,1781 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from base64 import b64encode, urlsafe_b64encode
+from io import BytesIO
+from unittest import mock, skipUnless
+
+import brotli
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient, APITestCase
+
+import foodgram.constants as const
+from foodgram.counters import get_counters, reconcile_counters
+from foodgram.pagination import CountStrategyPaginator, EstimatedCount
+from foodgram.versioning import (
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    VERSION_EPOCH,
+    bump_version,
+    get_version,
+    get_versions,
+    recipe_version,
+    version_cache,
+)
+from users.models import Follow, User
+from . import feed
+from . import images
+from . import ingredient_search
+from .similarity import update_similar_recipes
+from .payloads import INGREDIENTS_PAYLOAD, TAGS_PAYLOAD
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredients,
+    RecipeNeighbour,
+    RecipeTags,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    TimelineEntry,
+)
+
+RECIPES_URL = '/api/recipes/'
+RECIPE_URL = '/api/recipes/{}/'
+INGREDIENTS_URL = '/api/ingredients/'
+TAGS_URL = '/api/tags/'
+FEED_URL = '/api/recipes/feed/'
+SIMILAR_URL = '/api/recipes/{}/similar/'
+METRICS_URL = '/api/metrics'
+FAVORITE_URL = '/api/recipes/{}/favorite/'
+CART_URL = '/api/recipes/{}/shopping_cart/'
+SHOPPING_LIST_URL = '/api/recipes/download_shopping_cart/'
+IMAGE = 'recipes/images/recipe.png'
+RECIPE_IMAGE_URL = '/api/recipes/{}/image/'
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password=f'{username}-password',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+def create_recipe(author, name='Рецепт', **fields):
+    """Рецепт с уже построенными вариантами фото, без фоновой обработки."""
+    fields = {
+        'image': IMAGE,
+        'image_variants': {'source': IMAGE},
+        'text': 'Описание',
+        'cooking_time': 10,
+        **fields,
+    }
+    return Recipe.objects.create(name=name, author=author, **fields)
+
+
+def run_feed_tasks_inline():
+    """Фоновые задачи лент выполняются сразу, в потоке и транзакции теста."""
+    return mock.patch.multiple(
+        feed,
+        _executor=mock.Mock(submit=lambda task, *args: task(*args)),
+        run_task=lambda task, *args: task(*args),
+    )
+
+
+def save_image(name, size=(800, 600)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return default_storage.save(
+        f'recipes/images/{name}', ContentFile(buffer.getvalue())
+    )
+
+
+def encode_image(image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(buffer, image_format)
+    return 'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+
+
+def isolate_media(test):
+    """Файлы теста пишутся во временный каталог, обработка фото не идёт.
+
+    Возвращает подменённый пул фоновой обработки фото.
+    """
+    media_root = tempfile.TemporaryDirectory()
+    test.addCleanup(media_root.cleanup)
+    settings_override = override_settings(MEDIA_ROOT=media_root.name)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    executor = mock.patch.object(images, '_executor')
+    test.addCleanup(executor.stop)
+    return executor.start()
+
+
+def client_for(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+class RecipeQueriesTest(APITestCase):
+    """Число запросов к БД на списке и странице рецепта.
+
+    Запросы в списке не должны зависеть от числа рецептов на странице.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='reader-password',
+            first_name='Читатель',
+            last_name='Читателев',
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                password='author-password',
+                first_name='Автор',
+                last_name='Авторов',
+            )
+            for index in range(3)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {index}',
+                color=f'#00000{index}',
+                slug=f'tag{index}',
+            )
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}',
+                measurement_unit='г',
+            )
+            for index in range(4)
+        ]
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {index}',
+                author=authors[index % len(authors)],
+                image='recipes/images/recipe.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            RecipeTags.objects.create(recipe=recipe, tag=tags[index % 3])
+            for ingredient in ingredients[:1 + index % 4]:
+                RecipeIngredients.objects.create(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=100,
+                )
+            if index % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+        cls.recipe = Recipe.objects.first()
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.force_authenticate(self.user)
+
+    def get(self, client, url, count, data=None):
+        """Ответ с проверкой числа запросов без кеша ответов."""
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        with self.assertNumQueries(count):
+            response = client.get(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def assert_list_queries(self, client, count):
+        for limit in (2, 10):
+            with self.subTest(limit=limit):
+                response = self.get(
+                    client, RECIPES_URL, count, {'limit': limit}
+                )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(self.anonymous, 6)
+
+    def test_list_authorized(self):
+        self.assert_list_queries(self.authorized, 5)
+
+    def test_detail_anonymous(self):
+        response = self.get(
+            self.anonymous, RECIPE_URL.format(self.recipe.pk), 5
+        )
+        self.assertEqual(response.data['id'], self.recipe.pk)
+
+    def test_detail_authorized(self):
+        response = self.get(
+            self.authorized, RECIPE_URL.format(self.recipe.pk), 4
+        )
+        self.assertEqual(response.data['id'], self.recipe.pk)
+
+
+class VersioningTest(APITestCase):
+    """Версии данных в общем кеше."""
+
+    def test_read_does_not_create_versions(self):
+        names = [recipe_version(pk) for pk in range(400)]
+        self.assertEqual(set(get_versions(names)), {VERSION_EPOCH})
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(INGREDIENTS_VERSION)
+        bumped = get_version(INGREDIENTS_VERSION)
+        self.assertGreater(bumped, VERSION_EPOCH)
+        get_versions(recipe_version(pk) for pk in range(400, 800))
+        self.assertEqual(get_version(INGREDIENTS_VERSION), bumped)
+        self.assertEqual(len(version_cache().get_many(names)), 0)
+
+    def test_bump_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump_version(TAGS_VERSION)
+            self.assertEqual(get_version(TAGS_VERSION), VERSION_EPOCH)
+        callbacks[0]()
+        self.assertGreater(get_version(TAGS_VERSION), VERSION_EPOCH)
+
+
+class ConditionalRequestTest(APITestCase):
+    """ETag и Last-Modified по версиям данных, ответы 304 и 412."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.author)
+        cls.url = RECIPE_URL.format(cls.recipe.pk)
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def test_not_modified_without_serialization(self):
+        client = client_for(self.reader)
+        response = client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_per_user(self):
+        etag = client_for(self.reader).get(self.url)['ETag']
+        response = client_for(self.author).get(
+            self.url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_changed_after_recipe_update(self):
+        client = client_for(self.reader)
+        response = client.get(self.url)
+        self.recipe.name = 'Новое'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Новое')
+
+    def test_if_modified_since(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(recipe_version(self.recipe.pk))
+        client = client_for(self.reader)
+        last_modified = client.get(self.url)['Last-Modified']
+        response = client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_match_on_update(self):
+        client = client_for(self.author)
+        etag = client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(recipe_version(self.recipe.pk))
+        response = client.patch(
+            self.url, {'name': 'Новое'}, format='json', HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Рецепт')
+
+
+class AnonymousCacheTest(APITestCase):
+    """Кеш ответов анонимам по версиям данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author)
+        cls.tag = Tag.objects.create(name='Обед', color='#000000', slug='l')
+        RecipeTags.objects.create(recipe=cls.recipe, tag=cls.tag)
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def rename_recipe(self, name):
+        Recipe.objects.filter(pk=self.recipe.pk).update(name=name)
+
+    def get_names(self, client, **params):
+        response = client.get(RECIPES_URL, params)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_cached_without_recipe_queries(self):
+        self.get_names(self.client)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_names(self.client)
+        self.assertFalse(any(
+            'recipes_recipe' in query['sql']
+            for query in queries.captured_queries
+        ))
+
+    def test_invalidated_by_version(self):
+        self.get_names(self.client)
+        self.rename_recipe('Новое')
+        self.assertEqual(self.get_names(self.client), ['Рецепт'])
+        self.assertEqual(self.get_names(self.client, limit=5), ['Новое'])
+        self.assertEqual(
+            self.get_names(client_for(self.author)), ['Новое']
+        )
+        self.tag.name = 'Ужин'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.save()
+        response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.data['results'][0]['name'], 'Новое')
+        self.assertEqual(
+            response.data['results'][0]['tags'][0]['name'], 'Ужин'
+        )
+
+
+class FavoriteInvalidationTest(APITestCase):
+    """Избранное меняет версию рецепта, но не общую версию списков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.other = create_user('other')
+        cls.recipe = create_recipe(cls.author)
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def favorite(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(self.reader).post(
+                FAVORITE_URL.format(self.recipe.pk)
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @mock.patch('foodgram.conditional.time.time', return_value=time.time())
+    def test_list_versions_unchanged(self, _):
+        other = client_for(self.other)
+        etag = other.get(RECIPES_URL)['ETag']
+        recipes_version = get_version(RECIPES_VERSION)
+        self.favorite()
+        self.assertEqual(get_version(RECIPES_VERSION), recipes_version)
+        response = other.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_refreshed(self):
+        url = RECIPE_URL.format(self.recipe.pk)
+        other = client_for(self.other)
+        etag = other.get(url)['ETag']
+        self.assertEqual(client_for().get(url).data['favorites_count'], 0)
+        self.favorite()
+        response = other.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['favorites_count'], 1)
+        self.assertEqual(client_for().get(url).data['favorites_count'], 1)
+
+    def test_list_refreshed_after_timeout(self):
+        other = client_for(self.other)
+        etag = other.get(RECIPES_URL)['ETag']
+        self.favorite()
+        with mock.patch(
+            'foodgram.conditional.time.time',
+            return_value=time.time() + settings.RESPONSE_CACHE_TIMEOUT,
+        ):
+            response = other.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['favorites_count'], 1)
+
+
+class ReferencePayloadTest(APITestCase):
+    """Готовые сжатые ответы со справочниками тегов и ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', color='#ff0000', slug='breakfast')
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        for payload in (TAGS_PAYLOAD, INGREDIENTS_PAYLOAD):
+            payload.local = {}
+
+    def test_encodings(self):
+        expected = [{'id': Ingredient.objects.get().pk, 'name': 'Соль',
+                     'measurement_unit': 'г'}]
+        for accept_encoding, encoding, decompress in (
+            ('', None, bytes),
+            ('gzip, deflate', 'gzip', gzip.decompress),
+            ('gzip, br', 'br', brotli.decompress),
+        ):
+            with self.subTest(encoding=encoding):
+                response = self.client.get(
+                    INGREDIENTS_URL, HTTP_ACCEPT_ENCODING=accept_encoding
+                )
+                self.assertEqual(
+                    json.loads(decompress(response.content)), expected
+                )
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_compressed_etag_is_weak(self):
+        response = self.client.get(TAGS_URL, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertFalse(self.client.get(TAGS_URL)['ETag'].startswith('W/'))
+
+    def test_built_once_per_version(self):
+        self.client.get(TAGS_URL)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(TAGS_URL)
+        self.assertFalse(any(
+            'recipes_tag' in query['sql'] for query in queries.captured_queries
+        ))
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', color='#0000ff', slug='dinner')
+        slugs = [tag['slug'] for tag in self.client.get(TAGS_URL).json()]
+        self.assertCountEqual(slugs, ['breakfast', 'dinner'])
+
+
+class IngredientSearchTest(APITestCase):
+    """Автодополнение ингредиентов по индексу процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль', 'Сахар', 'Морская соль', 'Фасоль'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        ingredient_search._index.clear()
+        self.client = client_for()
+
+    def search(self, name):
+        response = self.client.get(INGREDIENTS_URL, {'name': name})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_order_of_matches(self):
+        self.assertEqual(
+            self.search('сол'), ['Соль', 'Морская соль', 'Фасоль']
+        )
+
+    def test_no_queries_between_checks(self):
+        self.search('с')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('сах'), ['Сахар'])
+
+    def test_rebuilt_after_interval(self):
+        self.search('с')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='Сахарная пудра', measurement_unit='г'
+            )
+        self.assertEqual(self.search('сах'), ['Сахар'])
+        with mock.patch(
+            'recipes.ingredient_search.time.monotonic',
+            return_value=(
+                time.monotonic() + settings.INGREDIENT_INDEX_CHECK_INTERVAL
+            ),
+        ):
+            self.assertEqual(
+                self.search('сах'), ['Сахар', 'Сахарная пудра']
+            )
+
+
+def encode_cursor(position):
+    return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+class RecipePaginationTest(APITestCase):
+    """Постраничный вывод и вывод по курсору списка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {index}',
+                author=author,
+                image=IMAGE,
+                image_variants={'source': IMAGE},
+                text='Описание',
+                cooking_time=10,
+            )
+            for index in range(const.MAX_PAGE_SIZE + 20)
+        )
+        cls.ids = list(
+            Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )
+        )
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.client = client_for()
+
+    def test_page_size_not_capped(self):
+        response = self.client.get(RECIPES_URL, {'limit': len(self.ids)})
+        self.assertEqual(response.data['count'], len(self.ids))
+        self.assertEqual(len(response.data['results']), len(self.ids))
+
+    def test_cursor_walk(self):
+        ids, url = [], RECIPES_URL + '?cursor=&limit=7'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, self.ids)
+
+    def test_cursor_page_size_capped(self):
+        response = self.client.get(
+            RECIPES_URL, {'cursor': '', 'limit': len(self.ids)}
+        )
+        self.assertEqual(len(response.data['results']), const.MAX_PAGE_SIZE)
+
+    def test_invalid_cursor(self):
+        for cursor in (
+            'not base64!',
+            encode_cursor({'pub_date': 1}),
+            encode_cursor(['garbage', 1]),
+            encode_cursor([5, 1]),
+            encode_cursor(['2024-01-01T00:00:00+00:00', 'x']),
+            encode_cursor(['2024-01-01T00:00:00+00:00']),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(RECIPES_URL, {'cursor': cursor})
+                self.assertEqual(
+                    response.status_code, status.HTTP_404_NOT_FOUND
+                )
+
+    def test_cursor_with_search_rejected(self):
+        response = self.client.get(
+            RECIPES_URL, {'cursor': '', 'search': 'Рецепт'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('search', response.data)
+        response = self.client.get(RECIPES_URL, {'search': 'Рецепт'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class PaginationCountTest(APITestCase):
+    """Способы подсчёта общего количества при постраничном выводе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipes = [create_recipe(cls.author) for _ in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = client_for(self.reader)
+
+    def get_count(self, **params):
+        return self.client.get(RECIPES_URL, params).data['count']
+
+    @override_settings(PAGINATION_COUNT_STRATEGY='cached')
+    def test_cached_until_version_changes(self):
+        self.assertEqual(self.get_count(), 3)
+        create_recipe(self.author)
+        self.assertEqual(self.get_count(), 3)
+        self.assertEqual(self.get_count(limit=1), 3)
+        with run_feed_tasks_inline(), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            create_recipe(self.author)
+        self.assertEqual(self.get_count(), 5)
+
+    @override_settings(PAGINATION_COUNT_STRATEGY='cached')
+    def test_cached_per_user_and_filters(self):
+        self.assertEqual(self.get_count(is_favorited=1), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        self.assertEqual(self.get_count(is_favorited=1), 1)
+        self.client = client_for(self.author)
+        self.assertEqual(self.get_count(is_favorited=1), 0)
+
+    def test_estimated_page_bounds_from_data(self):
+        paginator = CountStrategyPaginator(
+            list(range(5)), 2, lambda objects: EstimatedCount(2)
+        )
+        page = paginator.page(2)
+        self.assertEqual(list(page), [2, 3])
+        self.assertTrue(page.has_next())
+        self.assertFalse(paginator.page(3).has_next())
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+
+class RecipeSearchTest(APITestCase):
+    """Поиск рецептов по названию и описанию."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.borscht = create_recipe(author, 'Красный борщ')
+        cls.soup = create_recipe(
+            author, 'Суп', text='Почти как борщ, но без свёклы'
+        )
+        cls.salad = create_recipe(author, 'Салат')
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def search(self, value):
+        response = self.client.get(RECIPES_URL, {'search': value})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_and_text(self):
+        self.assertCountEqual(
+            self.search('борщ'), [self.borscht.pk, self.soup.pk]
+        )
+        self.assertEqual(self.search('Салат'), [self.salad.pk])
+        self.assertEqual(self.search('Пельмени'), [])
+
+    def test_empty_search_ignored(self):
+        self.assertEqual(len(self.search('')), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Поиск PostgreSQL')
+    def test_ranked_by_relevance(self):
+        self.assertEqual(self.search('борщ')[0], self.borscht.pk)
+        self.assertEqual(self.search('Красный борш'), [self.borscht.pk])
+
+
+class FeedTest(APITestCase):
+    """Лента подписок: рассылка при записи и знаменитости при чтении."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.fan = create_user('fan')
+        cls.author = create_user('author')
+        cls.star = create_user('star')
+
+    def setUp(self):
+        patcher = run_feed_tasks_inline()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = client_for(self.reader)
+
+    def publish(self, author, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_recipe(author, name)
+
+    def follow(self, user, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=user, author=author)
+
+    def unfollow(self, user, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(user=user, author=author).delete()
+
+    def feed_ids(self, limit=2):
+        ids, url = [], f'{FEED_URL}?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_fan_out_and_unfollow(self):
+        old = self.publish(self.author, 'Старый')
+        self.follow(self.reader, self.author)
+        new = self.publish(self.author, 'Новый')
+        self.publish(self.star, 'Чужой')
+        self.assertEqual(self.feed_ids(limit=1), [new.pk, old.pk])
+        self.unfollow(self.reader, self.author)
+        self.assertEqual(self.feed_ids(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+
+    def test_anonymous_rejected(self):
+        response = client_for().get(FEED_URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=2)
+    def test_celebrity_merged_on_read(self):
+        self.follow(self.reader, self.author)
+        self.follow(self.reader, self.star)
+        self.follow(self.fan, self.star)
+        first = self.publish(self.author, 'Первый')
+        starred = self.publish(self.star, 'Знаменитый')
+        last = self.publish(self.author, 'Последний')
+        self.assertFalse(TimelineEntry.objects.filter(recipe=starred))
+        self.assertEqual(
+            self.feed_ids(limit=1), [last.pk, starred.pk, first.pk]
+        )
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=2)
+    def test_backfill_when_author_drops_below_threshold(self):
+        self.follow(self.reader, self.star)
+        self.follow(self.fan, self.star)
+        starred = self.publish(self.star, 'Знаменитый')
+        self.unfollow(self.fan, self.star)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, recipe=starred)
+        )
+        self.assertEqual(self.feed_ids(), [starred.pk])
+
+    def test_unfollow_does_not_load_followers(self):
+        self.follow(self.reader, self.star)
+        with self.assertNumQueries(1):
+            feed.follower_removed(self.star.pk)
+
+
+class RecipeCountersTest(APITestCase):
+    """Счётчики избранного и покупок и их сверка с данными."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.author)
+
+    def test_changed_by_favorites_and_cart(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        cart = ShoppingCart.objects.create(
+            user=self.reader, recipe=self.recipe
+        )
+        cart.delete()
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count), (1, 0)
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+
+    def test_full_save_keeps_counters(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        stale.name = 'Новое название'
+        stale.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.recipe.name, 'Новое название')
+
+    def test_reconcile(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=5)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        counters = get_counters(apps)
+        self.assertEqual(
+            reconcile_counters(counters, dry_run=True),
+            {
+                'recipes.Recipe.favorites_count': 1,
+                'recipes.Recipe.in_carts_count': 0,
+                'users.User.recipes_count': 1,
+                'users.User.followers_count': 0,
+            },
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 5)
+        reconcile_counters(counters)
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(set(reconcile_counters(counters).values()), {0})
+
+
+class RecipeImageVariantsTest(APITestCase):
+    """Фоновая сборка уменьшенных копий фото и удаление старых файлов."""
+
+    def setUp(self):
+        self.executor = isolate_media(self)
+        self.author = create_user('author')
+
+    def create_recipe(self):
+        with run_feed_tasks_inline(), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            recipe = create_recipe(
+                self.author, image=save_image('photo.png'), image_variants={}
+            )
+        self.executor.submit.assert_called_once_with(
+            images.run_task, recipe.pk
+        )
+        return recipe
+
+    def test_variants_built(self):
+        recipe = self.create_recipe()
+        self.assertTrue(images.process_recipe_image(recipe.pk))
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.image_width, recipe.image_height), (800, 600))
+        self.assertEqual(recipe.image_variants['source'], recipe.image.name)
+        thumbnail = recipe.image_variants['thumbnail']
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (320, 240))
+        self.assertLessEqual({'jpeg', 'webp'}, set(thumbnail['files']))
+        for path in images.variant_files(recipe.image_variants):
+            self.assertTrue(default_storage.exists(path))
+        self.assertFalse(images.process_recipe_image(recipe.pk))
+
+    def test_replaced_image_drops_old_variants(self):
+        recipe = self.create_recipe()
+        images.process_recipe_image(recipe.pk)
+        recipe.refresh_from_db()
+        old_files = images.variant_files(recipe.image_variants)
+        recipe.image = save_image('other.png', (100, 100))
+        recipe.save()
+        self.assertTrue(images.process_recipe_image(recipe.pk))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_width, 100)
+        for path in old_files:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_result_for_replaced_image_discarded(self):
+        recipe = self.create_recipe()
+        make_variants = images.make_variants
+
+        def replace_during_processing(*args):
+            Recipe.objects.filter(pk=recipe.pk).update(image='other.png')
+            return make_variants(*args)
+
+        with mock.patch.object(
+            images, 'make_variants', side_effect=replace_during_processing
+        ):
+            self.assertFalse(images.process_recipe_image(recipe.pk))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, {})
+        _, files = default_storage.listdir(
+            f'{images.VARIANTS_DIR}/{recipe.pk}'
+        )
+        self.assertEqual(files, [])
+
+    def test_variants_deleted_with_recipe(self):
+        recipe = self.create_recipe()
+        images.process_recipe_image(recipe.pk)
+        recipe.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.executor.submit.assert_called_with(
+            images.delete_files, images.variant_files(recipe.image_variants)
+        )
+
+
+class RecipeImageUploadTest(APITestCase):
+    """Загрузка фото в base64 и файлом multipart/form-data."""
+
+    def setUp(self):
+        isolate_media(self)
+        self.author = create_user('author')
+        self.client = client_for(self.author)
+        self.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.tag = Tag.objects.create(name='Обед', color='#000000', slug='l')
+
+    def create(self, image):
+        return self.client.post(
+            RECIPES_URL,
+            {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': image,
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+            },
+            format='json',
+        )
+
+    def test_base64(self):
+        response = self.create(encode_image('GIF'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image = Recipe.objects.get().image
+        self.assertTrue(image.name.endswith('.gif'))
+        with default_storage.open(image.name) as file:
+            self.assertEqual(Image.open(file).size, (40, 30))
+
+    def test_invalid_base64(self):
+        for image in (
+            'data:image/png;base64,не base64',
+            'без маркера',
+            'data:image/png;base64,' + b64encode(b'not an image').decode(),
+        ):
+            with self.subTest(image=image):
+                response = self.create(image)
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_size_limit(self):
+        with mock.patch.object(const, 'MAX_IMAGE_SIZE', 50):
+            response = self.create(encode_image())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with mock.patch.object(const, 'MAX_IMAGE_PIXELS', 100):
+            response = self.create(encode_image())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_multipart(self):
+        recipe = create_recipe(self.author)
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, 'JPEG')
+        buffer.name = 'photo.jpg'
+        buffer.seek(0)
+        response = self.client.put(
+            RECIPE_IMAGE_URL.format(recipe.pk),
+            {'image': buffer},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image.name.endswith('.jpg'))
+        response = client_for(create_user('reader')).put(
+            RECIPE_IMAGE_URL.format(recipe.pk),
+            {'image': buffer},
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ShoppingListAggregateTest(APITestCase):
+    """Суммарный список покупок обновляется вместе с корзиной и составом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tag = Tag.objects.create(name='Обед', color='#000000', slug='l')
+        cls.salt, cls.sugar, cls.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар', 'Мука')
+        )
+        cls.recipes = [create_recipe(cls.author) for _ in range(2)]
+        for recipe, amount in zip(cls.recipes, (10, 20)):
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=cls.salt, amount=amount
+            )
+        RecipeIngredients.objects.create(
+            recipe=cls.recipes[1], ingredient=cls.sugar, amount=5
+        )
+
+    def get_items(self):
+        return {
+            ingredient_id: (amount, recipes_count)
+            for ingredient_id, amount, recipes_count
+            in ShoppingListItem.objects.filter(user=self.reader).values_list(
+                'ingredient_id', 'amount', 'recipes_count'
+            )
+        }
+
+    def test_cart_add_and_remove(self):
+        client = client_for(self.reader)
+        for recipe in self.recipes:
+            response = client.post(CART_URL.format(recipe.pk))
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.get_items(),
+            {self.salt.pk: (30, 2), self.sugar.pk: (5, 1)},
+        )
+        client.delete(CART_URL.format(self.recipes[1].pk))
+        self.assertEqual(self.get_items(), {self.salt.pk: (10, 1)})
+        client.delete(CART_URL.format(self.recipes[0].pk))
+        self.assertEqual(self.get_items(), {})
+
+    def test_recipe_update(self):
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        response = client_for(self.author).patch(
+            RECIPE_URL.format(self.recipes[1].pk),
+            {
+                'tags': [self.tag.pk],
+                'ingredients': [
+                    {'id': self.salt.pk, 'amount': 25},
+                    {'id': self.flour.pk, 'amount': 100},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.get_items(),
+            {self.salt.pk: (35, 2), self.flour.pk: (100, 1)},
+        )
+
+    def test_rebuild_command(self):
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        expected = self.get_items()
+        ShoppingListItem.objects.filter(ingredient=self.salt).update(amount=1)
+        ShoppingListItem.objects.filter(ingredient=self.sugar).delete()
+        call_command('rebuild_shopping_lists', stdout=mock.Mock())
+        self.assertEqual(self.get_items(), expected)
+
+
+class RecipeUpdateTest(APITestCase):
+    """Обновление рецепта меняет только отличающиеся связи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', color=f'#00000{index}',
+                               slug=f'tag{index}')
+            for index in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(3)
+        ]
+        cls.recipe = create_recipe(cls.author)
+        for tag in cls.tags[:2]:
+            RecipeTags.objects.create(recipe=cls.recipe, tag=tag)
+        for ingredient, amount in zip(cls.ingredients[:2], (10, 20)):
+            RecipeIngredients.objects.create(
+                recipe=cls.recipe, ingredient=ingredient, amount=amount
+            )
+
+    def get_links(self):
+        return (
+            dict(RecipeTags.objects.filter(
+                recipe=self.recipe
+            ).values_list('tag_id', 'pk')),
+            {
+                ingredient_id: (pk, amount)
+                for ingredient_id, pk, amount
+                in RecipeIngredients.objects.filter(
+                    recipe=self.recipe
+                ).values_list('ingredient_id', 'pk', 'amount')
+            },
+        )
+
+    def patch(self, tags, ingredients):
+        return client_for(self.author).patch(
+            RECIPE_URL.format(self.recipe.pk),
+            {
+                'tags': [tag.pk for tag in tags],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': amount}
+                    for ingredient, amount in ingredients
+                ],
+            },
+            format='json',
+        )
+
+    def test_only_changed_links_rewritten(self):
+        (tag_links, ingredient_links) = self.get_links()
+        first, second, third = self.ingredients
+        response = self.patch(
+            self.tags[1:], [(first, 10), (second, 25), (third, 5)]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_tag_links, new_ingredient_links = self.get_links()
+        self.assertEqual(set(new_tag_links), {tag.pk for tag in self.tags[1:]})
+        self.assertEqual(
+            new_tag_links[self.tags[1].pk], tag_links[self.tags[1].pk]
+        )
+        self.assertEqual(
+            new_ingredient_links[first.pk], ingredient_links[first.pk]
+        )
+        self.assertEqual(
+            new_ingredient_links[second.pk],
+            (ingredient_links[second.pk][0], 25),
+        )
+        self.assertEqual(new_ingredient_links[third.pk][1], 5)
+        self.assertEqual(
+            [ingredient['amount']
+             for ingredient in response.data['ingredients']],
+            [10, 25, 5],
+        )
+
+    def test_unchanged_links_not_written(self):
+        links = self.get_links()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(
+                self.tags[:2], zip(self.ingredients[:2], (10, 20))
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_links(), links)
+        self.assertFalse(any(
+            query['sql'].startswith(('INSERT', 'DELETE'))
+            for query in queries.captured_queries
+        ))
+
+    def test_rolled_back_on_error(self):
+        links = self.get_links()
+        with mock.patch.object(
+            RecipeIngredients.objects, 'bulk_create', side_effect=ValueError
+        ), self.assertRaises(ValueError):
+            self.patch(self.tags[2:], [(self.ingredients[2], 5)])
+        self.assertEqual(self.get_links(), links)
+
+
+class RecipeValidationTest(APITestCase):
+    """Теги и ингредиенты рецепта проверяются одним запросом на модель."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Обед', color='#000000', slug='l')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(10)
+        ]
+
+    def setUp(self):
+        isolate_media(self)
+
+    def create(self, tags, ingredient_ids):
+        return client_for(self.author).post(
+            RECIPES_URL,
+            {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': encode_image(),
+                'tags': tags,
+                'ingredients': [
+                    {'id': pk, 'amount': 5} for pk in ingredient_ids
+                ],
+            },
+            format='json',
+        )
+
+    def test_errors_combined(self):
+        first, second = self.ingredients[:2]
+        response = self.create(
+            [self.tag.pk, self.tag.pk, 998],
+            [first.pk, 999, second.pk, first.pk, 1000],
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['ingredients'],
+            {'missing': ['999', '1000'], 'duplicates': [str(first.pk)]},
+        )
+        self.assertEqual(
+            response.data['tags'],
+            {'missing': ['998'], 'duplicates': [str(self.tag.pk)]},
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_queries_do_not_depend_on_ingredients(self):
+        ids = [ingredient.pk for ingredient in self.ingredients]
+        with CaptureQueriesContext(connection) as queries:
+            self.create([self.tag.pk], ids[:2] + [999])
+        with self.assertNumQueries(len(queries)):
+            self.create([self.tag.pk], ids + [999])
+
+
+class ShoppingListAdminTest(APITestCase):
+    """Правка состава в админке пересчитывает суммарные списки покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='admin-password',
+        )
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.admin)
+        cls.salt, cls.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар')
+        )
+        cls.link = RecipeIngredients.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=10
+        )
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipe)
+
+    def test_inline_change_updates_shopping_lists(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            reverse('admin:recipes_recipe_change', args=(self.recipe.pk,)),
+            {
+                'name': self.recipe.name,
+                'author': self.admin.pk,
+                'text': self.recipe.text,
+                'cooking_time': self.recipe.cooking_time,
+                'recipeingredients-TOTAL_FORMS': 2,
+                'recipeingredients-INITIAL_FORMS': 1,
+                'recipeingredients-0-id': self.link.pk,
+                'recipeingredients-0-recipe': self.recipe.pk,
+                'recipeingredients-0-ingredient': self.salt.pk,
+                'recipeingredients-0-amount': 15,
+                'recipeingredients-1-recipe': self.recipe.pk,
+                'recipeingredients-1-ingredient': self.sugar.pk,
+                'recipeingredients-1-amount': 5,
+                'recipetags-TOTAL_FORMS': 0,
+                'recipetags-INITIAL_FORMS': 0,
+            },
+        )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=self.reader
+            ).values_list('ingredient_id', 'amount')),
+            {self.salt.pk: 15, self.sugar.pk: 5},
+        )
+
+
+class ExportDataTest(APITestCase):
+    """Выгрузка таблиц в NDJSON из одной транзакции."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.recipe = create_recipe(cls.author)
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipe)
+
+    def test_export_in_single_transaction(self):
+        from .management.commands.export_data import Command
+
+        depth = len(connection.savepoint_ids)
+
+        def check_atomic(command):
+            self.assertEqual(len(connection.savepoint_ids), depth + 1)
+
+        with tempfile.TemporaryDirectory() as output, mock.patch.object(
+            Command, 'start_snapshot', autospec=True, side_effect=check_atomic
+        ) as start_snapshot:
+            call_command('export_data', output, stdout=mock.Mock())
+            with open(f'{output}/recipes.ndjson', encoding='utf-8') as file:
+                recipes = [json.loads(line) for line in file]
+            with open(f'{output}/favorites.ndjson', encoding='utf-8') as file:
+                favorites = [json.loads(line) for line in file]
+        start_snapshot.assert_called_once()
+        self.assertEqual(
+            [(recipe['id'], recipe['author'], recipe['favorites_count'])
+             for recipe in recipes],
+            [(self.recipe.pk, self.author.email, 1)],
+        )
+        self.assertEqual(
+            favorites,
+            [{'user_id': self.reader.pk, 'recipe_id': self.recipe.pk}],
+        )
+
+    def test_since_and_gzip(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            pub_date='2020-01-01T00:00:00Z'
+        )
+        User.objects.filter(pk=self.author.pk).update(
+            date_joined='2020-01-01T00:00:00Z'
+        )
+        recipe = create_recipe(self.reader, 'Новый')
+        tag = Tag.objects.create(name='Обед', color='#000000', slug='lunch')
+        RecipeTags.objects.create(recipe=recipe, tag=tag)
+        RecipeIngredients.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit='г'
+            ),
+            amount=5,
+        )
+        with tempfile.TemporaryDirectory() as output:
+            call_command(
+                'export_data', output, '--gzip', '--since=2021-01-01',
+                stdout=mock.Mock(),
+            )
+            exported = {}
+            for name in ('users', 'recipes', 'favorites'):
+                with gzip.open(
+                    f'{output}/{name}.ndjson.gz', 'rt', encoding='utf-8'
+                ) as file:
+                    exported[name] = [json.loads(line) for line in file]
+        self.assertEqual(
+            [user['id'] for user in exported['users']], [self.reader.pk]
+        )
+        [row] = exported['recipes']
+        self.assertEqual(
+            (row['id'], row['tags'], row['ingredients']),
+            (
+                recipe.pk,
+                ['lunch'],
+                [{'name': 'Соль', 'measurement_unit': 'г', 'amount': 5}],
+            ),
+        )
+        self.assertEqual(len(exported['favorites']), 1)
+
+
+class ShoppingListExportTest(APITestCase):
+    """Выгрузка списка покупок в разных форматах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        salt, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар')
+        )
+        cls.recipes = [create_recipe(cls.reader, 'Пирог') for _ in range(2)]
+        for recipe, amounts in zip(cls.recipes, ((5, 20), (10, 0))):
+            for ingredient, amount in zip((salt, sugar), amounts):
+                if amount:
+                    RecipeIngredients.objects.create(
+                        recipe=recipe, ingredient=ingredient, amount=amount
+                    )
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+
+    def download(self, **params):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(SHOPPING_LIST_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        self.assertEqual(
+            self.download(format='txt').decode(),
+            'Список покупок:\nСахар - 20 (г)\nСоль - 15 (г)',
+        )
+
+    def test_txt_by_recipe_keeps_same_names_apart(self):
+        self.assertEqual(
+            self.download(format='txt', by_recipe='true').decode(),
+            'Список покупок:\n'
+            '\nПирог:\nСахар - 20 (г)\nСоль - 5 (г)\n'
+            '\nПирог:\nСоль - 10 (г)',
+        )
+
+    def test_csv(self):
+        self.assertEqual(
+            self.download(format='csv').decode().splitlines(),
+            ['name,measurement_unit,amount', 'Сахар,г,20', 'Соль,г,15'],
+        )
+
+    def test_json(self):
+        self.assertEqual(
+            json.loads(self.download(format='json', by_recipe='1')),
+            [
+                {'name': 'Сахар', 'measurement_unit': 'г', 'amount': 20,
+                 'recipe_id': self.recipes[0].pk, 'recipe': 'Пирог'},
+                {'name': 'Соль', 'measurement_unit': 'г', 'amount': 5,
+                 'recipe_id': self.recipes[0].pk, 'recipe': 'Пирог'},
+                {'name': 'Соль', 'measurement_unit': 'г', 'amount': 10,
+                 'recipe_id': self.recipes[1].pk, 'recipe': 'Пирог'},
+            ],
+        )
+
+    def test_empty_json(self):
+        ShoppingCart.objects.filter(user=self.reader).delete()
+        self.assertEqual(json.loads(self.download(format='json')), [])
+
+    def test_pdf(self):
+        self.assertTrue(self.download(format='pdf').startswith(b'%PDF'))
+
+
+class ImportRecipesTest(APITestCase):
+    """Пакетный импорт рецептов с продолжением с сохранённой позиции."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Обед', color='#000000', slug='l')
+        cls.salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/recipes.ndjson'
+
+    def write(self, *names, mode='w'):
+        with open(self.path, mode, encoding='utf-8') as file:
+            for name in names:
+                file.write(json.dumps({
+                    'name': name,
+                    'text': 'Описание',
+                    'cooking_time': 10,
+                    'image': IMAGE,
+                    'author': 'author',
+                    'tags': ['l'],
+                    'ingredients': [
+                        {'id': self.salt.pk, 'amount': 5},
+                        {'name': 'Соль', 'measurement_unit': 'г',
+                         'amount': 3},
+                    ],
+                }, ensure_ascii=False) + '\n')
+
+    def run_import(self, *args):
+        call_command(
+            'import_recipes', self.path, '--batch-size=2', *args,
+            stdout=mock.Mock(),
+        )
+        return list(Recipe.objects.order_by('pk').values_list(
+            'name', flat=True
+        ))
+
+    def test_import(self):
+        self.write('Первый', 'Второй', 'Третий')
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write('{"name": "Сломанный"\n')
+            file.write(json.dumps({'name': 'Без автора', 'author': 'nobody',
+                                   'tags': [], 'ingredients': [],
+                                   'text': '', 'cooking_time': 1,
+                                   'image': IMAGE}) + '\n')
+        self.assertEqual(self.run_import(), ['Первый', 'Второй', 'Третий'])
+        recipe = Recipe.objects.get(name='Второй')
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(
+            list(recipe.recipeingredients.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(self.salt.pk, 8)],
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+
+    def test_resumed_from_checkpoint(self):
+        self.write('Первый', 'Второй')
+        self.run_import()
+        self.write('Третий', mode='a')
+        self.assertEqual(self.run_import(), ['Первый', 'Второй', 'Третий'])
+        self.assertEqual(len(self.run_import('--restart')), 6)
+
+
+class ImportDataTest(APITestCase):
+    """Идемпотентный потоковый импорт ингредиентов и тегов."""
+
+    INGREDIENTS = [
+        {'name': 'Соль', 'measurement_unit': 'г'},
+        {'name': 'Соль', 'measurement_unit': 'щепотка'},
+        {'name': 'Соль', 'measurement_unit': 'г'},
+        {'name': '', 'measurement_unit': 'г'},
+        {'name': 'Сахар'},
+    ]
+    TAGS = [
+        {'name': 'Завтрак', 'color': '#FF0000', 'slug': 'breakfast'},
+        {'name': 'Обед', 'color': '#ff0000', 'slug': 'lunch'},
+        {'name': 'Ужин', 'color': 'синий', 'slug': 'dinner'},
+        {'name': 'Ужин', 'color': '#0000ff', 'slug': 'не slug'},
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.write('ingredients', self.INGREDIENTS)
+        self.write('tags', self.TAGS)
+
+    def write(self, name, rows):
+        with open(f'{self.path}/{name}.json', 'w', encoding='utf-8') as file:
+            file.write(json.dumps(rows, ensure_ascii=False, indent=2))
+
+    def run_import(self, *args):
+        output = mock.Mock()
+        call_command('import_data', f'--path={self.path}', '--batch-size=2',
+                     *args, stdout=output)
+        return ''.join(call.args[0] for call in output.write.call_args_list)
+
+    def test_idempotent(self):
+        output = self.run_import()
+        self.assertIn('ingredients: добавлено 2, без изменений 1, '
+                      'конфликтов 2', output)
+        self.assertIn('tags: добавлено 1, без изменений 0, конфликтов 3',
+                      output)
+        output = self.run_import()
+        self.assertIn('ingredients: добавлено 0, без изменений 3', output)
+        self.assertIn('tags: добавлено 0, без изменений 1', output)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list(
+                'name', 'measurement_unit'
+            )),
+            [('Соль', 'г'), ('Соль', 'щепотка')],
+        )
+        self.assertEqual(
+            list(Tag.objects.values_list('slug', flat=True)), ['breakfast']
+        )
+
+    def test_changed_tag_not_overwritten(self):
+        Tag.objects.create(name='Старый', color='#00ff00', slug='breakfast')
+        self.assertIn('tags: добавлено 1, без изменений 0, конфликтов 3',
+                      self.run_import())
+        self.assertEqual(
+            dict(Tag.objects.values_list('slug', 'name')),
+            {'breakfast': 'Старый', 'lunch': 'Обед'},
+        )
+
+    def test_dry_run(self):
+        self.run_import('--dry-run')
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+
+    def test_not_an_object(self):
+        self.write('ingredients', [{'name': 'Соль', 'measurement_unit': 'г'},
+                                   ['Сахар', 'г']])
+        with self.assertRaisesMessage(
+            CommandError, 'ingredients.json:6: ожидается JSON-объект'
+        ):
+            self.run_import()
+
+
+class GenerateFixturesTest(APITestCase):
+    """Синтетические данные согласованы со счётчиками и списками."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for index in range(3):
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}', slug=f't{index}'
+            )
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+
+    def setUp(self):
+        isolate_media(self)
+
+    def generate(self):
+        with run_feed_tasks_inline():
+            call_command(
+                'generate_fixtures', '--users=8', '--recipes=30',
+                '--follows=3', '--favorites=4', '--carts=2', '--seed=1',
+                stdout=mock.Mock(),
+            )
+
+    def test_consistent_data(self):
+        self.generate()
+        self.assertEqual(User.objects.count(), 8)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertTrue(Favorite.objects.exists())
+        self.assertFalse(
+            Follow.objects.filter(user=F('author')).exists()
+        )
+        self.assertEqual(
+            set(reconcile_counters(get_counters(apps), dry_run=True).values()),
+            {0},
+        )
+        output = mock.Mock()
+        call_command('rebuild_shopping_lists', '--verify', stdout=output)
+        self.assertIn('Расхождений не найдено', output.write.call_args.args[0])
+
+    def test_prefix_taken(self):
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+    def test_benchmark_percentile(self):
+        from .management.commands.benchmark import percentile
+
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+
+class MetricsTest(APITestCase):
+    """Метрики запросов по маршрутам в формате Prometheus."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='admin-password',
+        )
+        cls.reader = create_user('reader')
+        create_recipe(cls.reader)
+
+    def get_sample(self, name, **labels):
+        labels = {'route': 'recipes-list', 'method': 'GET', **labels}
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_observed(self):
+        requests = self.get_sample(
+            'foodgram_http_requests_total', status='200'
+        )
+        queries = self.get_sample('foodgram_db_queries_per_request_sum')
+        with CaptureQueriesContext(connection) as captured:
+            client_for(self.reader).get(RECIPES_URL)
+        self.assertEqual(
+            self.get_sample('foodgram_http_requests_total', status='200'),
+            requests + 1,
+        )
+        self.assertEqual(
+            self.get_sample('foodgram_db_queries_per_request_sum'),
+            queries + len(captured),
+        )
+        response = client_for(self.admin).get(METRICS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            b'foodgram_http_request_duration_seconds_bucket{le="0.005",'
+            b'method="GET",route="recipes-list"}',
+            response.content,
+        )
+
+    def test_staff_only(self):
+        for client in (client_for(), client_for(self.reader)):
+            response = client.get(METRICS_URL)
+            self.assertIn(
+                response.status_code,
+                (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN),
+            )
+
+
+class ProfilingTest(APITestCase):
+    """Профилирование запроса по заголовку X-Profile для персонала."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='admin-password',
+        )
+        cls.reader = create_user('reader')
+        create_recipe(cls.reader)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(PROFILING_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def client_with_token(self, user):
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def test_staff_request_profiled(self):
+        response = self.client_with_token(self.admin).get(
+            RECIPES_URL, {'profile': '', 'limit': 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, '
+            r'render;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+        name = response['X-Profile-Id']
+        with open(f'{self.directory}/{name}.json', encoding='utf-8') as file:
+            report = json.load(file)
+        self.assertEqual(report['route'], 'recipes-list')
+        self.assertEqual(report['path'], f'{RECIPES_URL}?limit=1')
+        self.assertGreater(report['queries']['count'], 0)
+        self.assertTrue(any(
+            frame.startswith('foodgram/pagination.py')
+            for query in report['queries']['statements']
+            for frame in query['stack']
+        ))
+
+    def test_ignored_for_others(self):
+        for client in (client_for(), self.client_with_token(self.reader)):
+            response = client.get(RECIPES_URL, HTTP_X_PROFILE='1')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('Server-Timing', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class SimilarRecipesTest(APITestCase):
+    """Похожие рецепты по ингредиентам и тегам, полный и частичный расчёт."""
+
+    COMPOSITIONS = {
+        'Пирог': ('Мука', 'Сахар', 'Яйцо'),
+        'Кекс': ('Мука', 'Сахар', 'Яйцо', 'Масло'),
+        'Блины': ('Мука', 'Молоко'),
+        'Салат': ('Огурец', 'Помидор'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.ingredients = {}
+        cls.recipes = {}
+        for name, ingredient_names in cls.COMPOSITIONS.items():
+            recipe = cls.recipes[name] = create_recipe(author, name)
+            for ingredient_name in ingredient_names:
+                ingredient = cls.ingredients.get(ingredient_name)
+                if ingredient is None:
+                    ingredient = cls.ingredients[ingredient_name] = (
+                        Ingredient.objects.create(
+                            name=ingredient_name, measurement_unit='г'
+                        )
+                    )
+                RecipeIngredients.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+
+    def get_similar(self, name):
+        response = self.client.get(SIMILAR_URL.format(self.recipes[name].pk))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['name'] for recipe in response.data]
+
+    def get_neighbours(self):
+        return {
+            (recipe_id, neighbour_id): round(score, 5)
+            for recipe_id, neighbour_id, score
+            in RecipeNeighbour.objects.values_list(
+                'recipe_id', 'neighbour_id', 'score'
+            )
+        }
+
+    def test_similar(self):
+        self.assertEqual(update_similar_recipes(full=True, count=2), (4, 4))
+        self.assertEqual(self.get_similar('Пирог'), ['Кекс', 'Блины'])
+        self.assertEqual(self.get_similar('Салат'), [])
+        response = self.client.get(SIMILAR_URL.format(0))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_incremental_matches_full(self):
+        update_similar_recipes(full=True, count=2)
+        self.assertEqual(update_similar_recipes(count=2), (0, 0))
+        RecipeIngredients.objects.filter(
+            recipe=self.recipes['Блины'], ingredient=self.ingredients['Молоко']
+        ).update(ingredient=self.ingredients['Сахар'])
+        RecipeIngredients.objects.create(
+            recipe=self.recipes['Блины'],
+            ingredient=self.ingredients['Яйцо'],
+            amount=1,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            changed, _ = update_similar_recipes(count=2)
+        self.assertEqual(changed, 1)
+        self.assertEqual(self.get_similar('Пирог'), ['Блины', 'Кекс'])
+        incremental = self.get_neighbours()
+        update_similar_recipes(full=True, count=2)
+        self.assertEqual(incremental, self.get_neighbours())
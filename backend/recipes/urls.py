@@ -5,6 +5,7 @@ from .views import (
     FavoriteView,
     ShoppingCartView,
     IngredientsView,
+    RecipeImageView,
     RecipeView,
     TagView,
     download_shopping_cart
@@ -17,6 +18,7 @@ router.register(r'recipes', RecipeView, basename='recipes')
 
 urlpatterns = [
     path('recipes/<int:pk>/favorite/', FavoriteView.as_view(),),
+    path('recipes/<int:pk>/image/', RecipeImageView.as_view(),),
     path('recipes/<int:pk>/shopping_cart/', ShoppingCartView.as_view(),),
     path(
         'recipes/download_shopping_cart/',
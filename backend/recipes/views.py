@@ -1,11 +1,19 @@
-from django.db.models import Sum, OuterRef, Exists, Value
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Exists, Prefetch, Value
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import (
+    action,
+    api_view,
+    permission_classes,
+    renderer_classes,
+)
 from rest_framework.views import APIView
 
 from .serializers import (
@@ -14,9 +22,21 @@ from .serializers import (
     CreateUpdateRecipeSerializer,
     ShowRecipeSerializer,
     FavoriteSerializer,
+    RecipeImageSerializer,
+    ShortRecipeSerializer,
     ShoppingCartSerializer,
 )
+from .feed import FeedPagination
 from .filters import IngredientFilter, RecipeFilter
+from .ingredient_search import get_index_state, get_ingredient_index
+from .payloads import INGREDIENTS_PAYLOAD, TAGS_PAYLOAD
+from .renderers import (
+    CSVRenderer,
+    JSONRenderer,
+    PDFRenderer,
+    PlainTextRenderer,
+)
+from .shopping_list import EXPORT_FORMATS, get_shopping_list
 from .models import (
     Recipe,
     Ingredient,
@@ -25,17 +45,40 @@ from .models import (
     Favorite,
     ShoppingCart,
 )
+from foodgram.cache import AnonymousCacheMixin
+from foodgram.conditional import ConditionalRequestMixin
+from foodgram.pagination import SelectablePaginationMixin
 from foodgram.permissions import IsAuthorOrAdminOrReadOnly, IsAdminOrReadOnly
+from foodgram.versioning import (
+    AUTHORS_VERSION,
+    FEED_VERSION,
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    SIMILAR_VERSION,
+    TAGS_VERSION,
+    recipe_version,
+    user_version,
+)
+from users.models import Follow
 
 
-class TagView(viewsets.ReadOnlyModelViewSet):
+class TagView(ConditionalRequestMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
+    condition_versions = (TAGS_VERSION,)
 
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return TAGS_PAYLOAD.response(request)
 
-class IngredientsView(viewsets.ReadOnlyModelViewSet):
+
+class IngredientsView(
+    ConditionalRequestMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
@@ -43,22 +86,87 @@ class IngredientsView(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ('name',)
     pagination_class = None
+    condition_versions = (INGREDIENTS_VERSION,)
+
+    def get_condition_version_values(self, request, names):
+        if not request.query_params.get('name'):
+            return super().get_condition_version_values(request, names)
+        # Автодополнение проверяет ETag по версии индекса процесса, не
+        # обращаясь к базе на каждое нажатие клавиши.
+        return [get_index_state().version]
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            if (request.accepted_renderer.format == 'json'
+                    and not request.query_params):
+                return INGREDIENTS_PAYLOAD.response(request)
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit and limit.isdigit() else None
+        return Response(get_ingredient_index().search(name, limit))
 
-class RecipeView(viewsets.ModelViewSet):
+
+class RecipeView(
+    ConditionalRequestMixin,
+    AnonymousCacheMixin,
+    SelectablePaginationMixin,
+    viewsets.ModelViewSet,
+):
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    cursor_incompatible_params = ('search',)
+    cache_versions = (RECIPES_VERSION, TAGS_VERSION, INGREDIENTS_VERSION)
+    lookup_value_regex = r'\d+'
 
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return CreateUpdateRecipeSerializer
         return ShowRecipeSerializer
 
+    def get_condition_versions(self):
+        if self.action == 'feed':
+            return (FEED_VERSION,) + self.cache_versions
+        if self.action == 'similar':
+            return (SIMILAR_VERSION, RECIPES_VERSION)
+        if 'pk' in self.kwargs:
+            return (
+                recipe_version(self.kwargs['pk']),
+                AUTHORS_VERSION,
+                TAGS_VERSION,
+                INGREDIENTS_VERSION,
+            )
+        return self.cache_versions
+
+    def get_condition_timeout(self):
+        # Избранное и покупки меняют только версию рецепта, поэтому
+        # счётчики в списках обновляются по времени, как и кеш анонимов.
+        if 'pk' in self.kwargs:
+            return None
+        return settings.RESPONSE_CACHE_TIMEOUT
+
+    def get_cache_versions(self):
+        return self.get_condition_versions()
+
+    def get_count_versions(self):
+        if self.request.user.is_authenticated:
+            return (RECIPES_VERSION, user_version(self.request.user.pk))
+        return (RECIPES_VERSION,)
+
     def get_queryset(self):
         user = self.request.user
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'recipeingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
         if user.is_authenticated:
-            return Recipe.objects.annotate(
+            return recipes.annotate(
                 is_favorited=Exists(
                     Favorite.objects.filter(
                         recipe=OuterRef('pk'),
@@ -70,19 +178,72 @@ class RecipeView(viewsets.ModelViewSet):
                         recipe=OuterRef('pk'),
                         user=user
                     )
-                )
+                ),
+                is_author_subscribed=Exists(
+                    Follow.objects.filter(
+                        author=OuterRef('author'),
+                        user=user
+                    )
+                ),
             )
-        return Recipe.objects.annotate(
+        return recipes.annotate(
             is_favorited=Value(False),
             is_in_shopping_cart=Value(False)
         )
 
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Рецепты авторов из подписок, от новых к старым."""
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            self.get_queryset(), request, view=self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        """Похожие по ингредиентам и тегам рецепты, от более похожих.
+
+        Списки строит команда update_similar_recipes.
+        """
+        recipe = get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        recipes = Recipe.objects.filter(
+            neighbour_of__recipe=recipe
+        ).order_by('-neighbour_of__score', 'pk').only(
+            *ShortRecipeSerializer.Meta.fields
+        )
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+
+class RecipeImageView(APIView):
+    """Замена фото рецепта загрузкой файла в multipart/form-data."""
+
+    permission_classes = (IsAuthorOrAdminOrReadOnly,)
+    parser_classes = (MultiPartParser,)
+
+    def put(self, request, pk):
+        recipe = get_object_or_404(Recipe, id=pk)
+        self.check_object_permissions(request, recipe)
+        serializer = RecipeImageSerializer(
+            recipe,
+            data=request.data,
+            context={'request': request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
 
 class UsingRecipesView(APIView):
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     serializer_class = None
     model = None
 
+    @transaction.atomic
     def post(self, request, pk):
         serializer = self.serializer_class(
             data={'user': request.user.pk, 'recipe': pk},
@@ -93,6 +254,7 @@ class UsingRecipesView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def delete(self, request, pk):
         user = request.user
         recipe = get_object_or_404(Recipe, id=pk)
@@ -119,19 +281,21 @@ class ShoppingCartView(UsingRecipesView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([PlainTextRenderer, CSVRenderer, JSONRenderer, PDFRenderer])
 def download_shopping_cart(request):
-    ingredients = RecipeIngredients.objects.filter(
-        recipe__shoppingcart__user=request.user
-    ).order_by('ingredient__name').values(
-        'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    shopping_list = 'Список покупок:'
-    for ingredient in ingredients:
-        shopping_list += (
-            f'\n{ingredient["ingredient__name"]} - '
-            f'{ingredient["amount"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-        )
-    response = HttpResponse(shopping_list, content_type='text/plain')
-    response['Content-Disposition'] = 'attachment; filename=shopping_list.txt'
+    """Отдаёт список покупок потоком в формате txt, csv, json или pdf.
+
+    Формат выбирается параметром ?format= или заголовком Accept,
+    параметр ?by_recipe=true разбивает список по рецептам.
+    """
+    extension = request.accepted_renderer.format
+    content_type, writer = EXPORT_FORMATS[extension]
+    by_recipe = request.query_params.get('by_recipe') in ('1', 'true')
+    response = StreamingHttpResponse(
+        writer(get_shopping_list(request.user, by_recipe), by_recipe),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename=shopping_list.{extension}'
+    )
     return response
@@ -3,11 +3,14 @@ from django.contrib.auth.models import AbstractUser
 from django.forms import ValidationError
 
 import foodgram.constants as const
+from foodgram.counters import CountersModelMixin
 
 
-class User(AbstractUser):
+class User(CountersModelMixin, AbstractUser):
     """Модель пользователей."""
 
+    counter_fields = ('recipes_count', 'followers_count')
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
     username = models.CharField(
@@ -32,6 +35,16 @@ class User(AbstractUser):
         blank=True,
         verbose_name='Фамилия',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -5,6 +5,29 @@ from rest_framework import serializers
 from .models import User, Follow
 
 
+def get_subscribed_author_ids(request):
+    """Id авторов, на которых подписан текущий пользователь.
+
+    Загружаются одним запросом и запоминаются на объекте запроса, поэтому
+    все сериализаторы пользователей в ответе используют один и тот же набор.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_subscribed_author_ids'):
+        request._subscribed_author_ids = frozenset(
+            request.user.follower.values_list('author_id', flat=True)
+        )
+    return request._subscribed_author_ids
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None, если он не задан."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is not None and re.match(r'^\d+$', recipes_limit):
+        return int(recipes_limit)
+    return None
+
+
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField('get_is_subscribed')
 
@@ -17,13 +40,16 @@ class UserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'is_subscribed',
+            'recipes_count',
+            'followers_count',
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request
-                and request.user.is_authenticated
-                and request.user.follower.filter(author=obj.pk).exists())
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in get_subscribed_author_ids(
+            self.context.get('request')
+        )
 
 
 class CreateUserSerializer(serializers.ModelSerializer):
@@ -60,12 +86,10 @@ class PasswordSerializer(serializers.Serializer):
 
 class ShowSubscriptionsSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField('get_recipes')
-    recipes_count = serializers.SerializerMethodField('get_recipes_count')
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + (
             'recipes',
-            'recipes_count',
         )
         read_only_fields = ('email', 'username')
 
@@ -73,11 +97,13 @@ class ShowSubscriptionsSerializer(UserSerializer):
         from recipes.serializers import ShortRecipeSerializer
 
         request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if (recipes_limit is not None
-                and bool(re.match(r'^\d+$', recipes_limit))):
-            recipes = recipes[:int(recipes_limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return ShortRecipeSerializer(
             recipes,
             many=True,
@@ -85,9 +111,6 @@ class ShowSubscriptionsSerializer(UserSerializer):
             context={'request': request},
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class EditSubscriptionsSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -123,6 +146,12 @@ class EditSubscriptionsSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'errors': 'Вы не подписаны.'})
         return data
 
+    def create(self, validated_data):
+        follow = super().create(validated_data)
+        # Счётчик подписчиков увеличен в базе сигналом, а не в объекте.
+        follow.author.refresh_from_db(fields=('followers_count',))
+        return follow
+
     def to_representation(self, instance):
         return ShowSubscriptionsSerializer(
             instance.author,
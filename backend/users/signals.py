@@ -0,0 +1,37 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram.counters import change_counter
+from foodgram.versioning import (
+    AUTHORS_VERSION,
+    RECIPES_VERSION,
+    USERS_VERSION,
+    bump_version,
+    user_version,
+)
+from .models import Follow, User
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follows_changed(instance, **kwargs):
+    bump_version(user_version(instance.user_id))
+
+
+def author_counters_changed():
+    """Счётчики автора выводятся в пользователях и в рецептах."""
+    bump_version(USERS_VERSION)
+    bump_version(AUTHORS_VERSION)
+    bump_version(RECIPES_VERSION)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+        author_counters_changed()
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    change_counter(User, instance.author_id, 'followers_count', -1)
+    author_counters_changed()
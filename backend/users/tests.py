@@ -0,0 +1,158 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from recipes.models import Recipe
+from .models import Follow, User
+
+USERS_URL = '/api/users/'
+SUBSCRIBE_URL = '/api/users/{}/subscribe/'
+SUBSCRIPTIONS_URL = '/api/users/subscriptions/'
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f'{username}@example.com',
+        password=f'{username}-password',
+        first_name='Имя',
+        last_name='Фамилия',
+    )
+
+
+class FollowersCountTest(APITestCase):
+    """Счётчик подписчиков меняется в базе и виден в ответах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.fan = create_user('fan')
+
+    def subscribe(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(SUBSCRIBE_URL.format(self.author.pk))
+
+    def test_subscribe_response_has_new_count(self):
+        response = self.subscribe(self.reader)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['followers_count'], 1)
+        self.assertEqual(self.subscribe(self.fan).data['followers_count'], 2)
+
+    def test_unsubscribe_decrements(self):
+        self.subscribe(self.reader)
+        response = self.client.delete(SUBSCRIBE_URL.format(self.author.pk))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_full_save_keeps_count(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        stale.first_name = 'Другое'
+        stale.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.author.first_name, 'Другое')
+
+
+class IsSubscribedTest(APITestCase):
+    """Подписки текущего пользователя загружаются одним запросом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.authors = [create_user(f'author{index}') for index in range(3)]
+        Follow.objects.create(user=cls.reader, author=cls.authors[0])
+
+    def get_users(self):
+        self.client.force_authenticate(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(USERS_URL, {'limit': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_flags(self):
+        response, _ = self.get_users()
+        self.assertEqual(
+            {user['id']: user['is_subscribed']
+             for user in response.data['results']},
+            {
+                self.reader.pk: False,
+                self.authors[0].pk: True,
+                self.authors[1].pk: False,
+                self.authors[2].pk: False,
+            },
+        )
+
+    def test_queries_do_not_depend_on_page_size(self):
+        _, expected = self.get_users()
+        for index in range(3, 8):
+            Follow.objects.create(
+                user=self.reader, author=create_user(f'author{index}')
+            )
+        response, queries = self.get_users()
+        self.assertEqual(len(response.data['results']), 9)
+        self.assertEqual(queries, expected)
+
+
+class SubscriptionsTest(APITestCase):
+    """Последние рецепты авторов подписок с лимитом recipes_limit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.authors = [create_user(f'author{index}') for index in range(3)]
+        cls.recipes = {
+            author.pk: [
+                Recipe.objects.create(
+                    name=f'Рецепт {index}',
+                    author=author,
+                    image='recipes/images/recipe.png',
+                    image_variants={'source': 'recipes/images/recipe.png'},
+                    text='Описание',
+                    cooking_time=10,
+                ).pk
+                for index in range(3)
+            ]
+            for author in cls.authors
+        }
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def get_subscriptions(self, **params):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(SUBSCRIPTIONS_URL, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_recipes_limit(self):
+        results = self.get_subscriptions(recipes_limit=2)
+        self.assertEqual(
+            {author['id']: [recipe['id'] for recipe in author['recipes']]
+             for author in results},
+            {
+                author.pk: self.recipes[author.pk][:0:-1]
+                for author in self.authors[:2]
+            },
+        )
+        self.assertTrue(all(author['is_subscribed'] for author in results))
+
+    def test_without_limit(self):
+        results = self.get_subscriptions()
+        self.assertEqual(
+            [len(author['recipes']) for author in results], [3, 3]
+        )
+
+    def test_queries_do_not_depend_on_authors(self):
+        self.client.force_authenticate(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(SUBSCRIPTIONS_URL, {'recipes_limit': 2})
+        Follow.objects.create(user=self.reader, author=self.authors[2])
+        with self.assertNumQueries(len(queries)):
+            self.client.get(SUBSCRIPTIONS_URL, {'recipes_limit': 2})
+
+    def test_empty(self):
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.get_subscriptions(recipes_limit=2), [])
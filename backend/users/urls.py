@@ -1,10 +1,14 @@
 from django.urls import path, re_path, include
+from rest_framework.routers import DefaultRouter
 
-from .views import SubscriptionsViewSet
+from .views import SubscriptionsViewSet, UserViewSet
+
+router = DefaultRouter()
+router.register('users', UserViewSet)
 
 urlpatterns = [
     path('users/subscriptions/', SubscriptionsViewSet.as_view(),),
     path('users/<int:pk>/subscribe/', SubscriptionsViewSet.as_view(),),
     re_path(r'^auth/', include('djoser.urls.authtoken')),
-    path('', include('djoser.urls')),
+    path('', include(router.urls)),
 ]
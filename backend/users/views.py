@@ -1,3 +1,6 @@
+from django.db.models import F, OuterRef, Prefetch, Subquery, Value
+from django.db.models.query import prefetch_related_objects
+from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, views
 from rest_framework.permissions import (
     IsAuthenticated,
@@ -7,20 +10,66 @@ from rest_framework.response import Response
 from .serializers import (
     ShowSubscriptionsSerializer,
     EditSubscriptionsSerializer,
+    get_recipes_limit,
 )
 from .models import User, Follow
-from foodgram.pagination import CustomPagination
+from foodgram.conditional import ConditionalRequestMixin
+from foodgram.pagination import get_paginator
+from foodgram.versioning import RECIPES_VERSION, USERS_VERSION, user_version
+from recipes.models import Recipe
 
 
-class SubscriptionsViewSet(views.APIView):
+def prefetch_limited_recipes(authors, recipes_limit):
+    """Загружает последние рецепты авторов страницы одним запросом.
+
+    При заданном лимите для каждого рецепта коррелированным подзапросом
+    проверяется, что он входит в первые recipes_limit рецептов своего
+    автора; подзапрос читает индекс (author, -pub_date, -id).
+    Результат сохраняется в атрибут limited_recipes каждого автора.
+    """
+    if not authors:
+        return
+    recipes = Recipe.objects.all()
+    if recipes_limit is not None:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author_id=OuterRef('author_id'),
+            ).order_by('-pub_date', '-id').values('pk')[:recipes_limit]
+        ))
+    prefetch_related_objects(
+        authors,
+        Prefetch('recipes', queryset=recipes, to_attr='limited_recipes'),
+    )
+
+
+class UserViewSet(ConditionalRequestMixin, DjoserUserViewSet):
+    condition_versions = (USERS_VERSION,)
+
+
+class SubscriptionsViewSet(ConditionalRequestMixin, views.APIView):
     permission_classes = (IsAuthenticated,)
+    cursor_ordering = ('-subscription_id',)
+    condition_versions = (RECIPES_VERSION, USERS_VERSION)
+
+    def get_count_versions(self):
+        return (user_version(self.request.user.pk),)
 
     def get(self, request):
-        subscriptions = User.objects.filter(following__user=self.request.user)
-        paginator = CustomPagination()
+        subscriptions = User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True),
+            subscription_id=F('following__id'),
+        ).order_by('-subscription_id')
+        paginator = get_paginator(request)
         paginated_queryset = paginator.paginate_queryset(
             subscriptions,
             request,
+            view=self,
+        )
+        prefetch_limited_recipes(
+            paginated_queryset,
+            get_recipes_limit(request),
         )
         serializer = ShowSubscriptionsSerializer(
             paginated_queryset,